@@ -0,0 +1,69 @@
+import re
+import time
+import argparse
+from bs4 import BeautifulSoup
+from benchmarks.corpus import load_pages
+from modules.enrich_leads.contact_extractor import extract_contacts
+
+# Patterns used by the enrich scrapers before the shared extractor
+LEGACY_EMAIL_REGEX = r"[a-z0-9\.\-+_]+@[a-z0-9\.\-+_]+\.[a-z]+"
+LEGACY_PHONE_REGEX = r"^((\+|00(\s|\s?\-\s?)?)31(\s|\s?\-\s?)?(\(0\)[\-\s]?)?|0)[1-9]((\s|\s?\-\s?)?[0-9])((\s|\s?-\s?)?[0-9])((\s|\s?-\s?)?[0-9])\s?[0-9]\s?[0-9]\s?[0-9]\s?[0-9]\s?[0-9]$"
+
+
+def legacy_extract(text, hrefs):
+    emails = list(set(re.findall(LEGACY_EMAIL_REGEX, text)))
+    phones = list(set(re.findall(LEGACY_PHONE_REGEX, text)))
+
+    return emails, phones
+
+
+def load_corpus(directory, size):
+    pages = load_pages(directory, size)
+
+    # Parsing is not part of the measurement
+    corpus = []
+
+    for html in pages:
+        soup = BeautifulSoup(html, "html.parser")
+        hrefs = [link.get("href") for link in soup.find_all("a")]
+
+        corpus.append((soup.get_text(), hrefs))
+
+    return corpus
+
+
+def run(extract, corpus, rounds):
+    found_emails = 0
+    found_phones = 0
+
+    start = time.perf_counter()
+
+    for _ in range(rounds):
+        for text, hrefs in corpus:
+            emails, phones = extract(text, hrefs)
+
+            found_emails += len(emails)
+            found_phones += len(phones)
+
+    elapsed = time.perf_counter() - start
+
+    return elapsed, found_emails // rounds, found_phones // rounds
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", default="data/pages")
+    parser.add_argument("--size", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus, args.size)
+    total_bytes = sum(len(text.encode("utf-8")) for text, _ in corpus) * args.rounds
+    total_pages = len(corpus) * args.rounds
+
+    for name, extract in [("legacy", legacy_extract), ("extractor", extract_contacts)]:
+        elapsed, emails, phones = run(extract, corpus, args.rounds)
+
+        print(
+            f"{name:>10}: {total_pages / elapsed:8.1f} pages/s | {total_bytes / elapsed / 1024 / 1024:6.1f} MB/s | {emails} emails | {phones} phones"
+        )
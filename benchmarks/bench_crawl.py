@@ -0,0 +1,236 @@
+import os
+import sys
+import time
+import argparse
+import resource
+import tempfile
+import importlib
+import subprocess
+import tracemalloc
+from benchmarks.synthetic_web import SyntheticWeb, add_arguments
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Arguments passed on to the synthetic web server
+SERVER_ARGUMENTS = [
+    "sites",
+    "pages",
+    "links",
+    "emails",
+    "phones",
+    "latency",
+    "error_rate",
+    "sitemap_rate",
+    "seed",
+]
+
+
+def start_server(args):
+    command = [
+        sys.executable,
+        "-m",
+        "benchmarks.synthetic_web",
+        "--port",
+        str(args.port),
+    ]
+
+    for name in SERVER_ARGUMENTS:
+        command += [f"--{name.replace('_', '-')}", str(getattr(args, name))]
+
+    server = subprocess.Popen(command, cwd=REPO_ROOT, stdout=subprocess.PIPE, text=True)
+
+    # Wait until the server is listening
+    print(server.stdout.readline().strip())
+
+    return server
+
+
+def prepare_workdir():
+    # The stages write their output and state relative to the working directory
+    workdir = tempfile.mkdtemp(prefix="bench_crawl_")
+    os.makedirs(os.path.join(workdir, "data", "history"))
+    os.chdir(workdir)
+
+    return workdir
+
+
+def write_leads(web):
+    with open("data/leads_benchmark.csv", "w") as f:
+        f.write("product,company,website,technology\n")
+
+        for lead in web.leads():
+            f.write(f"{lead['product']},{lead['company']},{lead['website']},\n")
+
+
+def bench_filter(web, workers):
+    filter_shops_platform = importlib.import_module(
+        "modules.generate_leads.filter_shops_platform"
+    )
+
+    start = time.perf_counter()
+    result = filter_shops_platform.filter_shops_platform(workers)
+    elapsed = time.perf_counter() - start
+
+    detected = {row["website"]: row["technology"] for row in result}
+
+    correct = sum(
+        1
+        for lead, site in zip(web.leads(), web.sites.values())
+        if detected.get(lead["website"]) == site.platform
+    )
+
+    return {
+        "leads/s": len(web.sites) / elapsed,
+        "accuracy": correct / len(web.sites),
+    }
+
+
+def bench_enrich(web):
+    enrich = importlib.import_module("modules.enrich_leads.beautiful_soup_enrich_leads")
+    store = importlib.import_module("modules.utils.state_store").get_store()
+
+    # The synthetic web is served over plain HTTP
+    enrich.SCHEME = "http"
+
+    fetches = []
+    pages = 0
+    reached = 0
+    found_emails = 0
+    found_phones = 0
+    planted_emails = 0
+    planted_phones = 0
+
+    start = time.perf_counter()
+
+    for lead, site in zip(web.leads(), web.sites.values()):
+        count = [0]
+
+        def counting_fetch(url, deadline=None):
+            count[0] += 1
+            return enrich.fetch_page(url, deadline=deadline)
+
+        enrich.scrape_website(lead["website"], lead["company"], counting_fetch)
+
+        rows = store.execute(
+            "SELECT kind, value FROM contacts WHERE company = ?", (lead["company"],)
+        )
+        contacts = {(kind, value) for kind, value in rows}
+
+        emails = [value for kind, value in contacts if kind == "email"]
+        phones = [value for kind, value in contacts if kind == "phone"]
+
+        if enrich.check_break_condition(emails, phones, site.host):
+            reached += 1
+            fetches.append(count[0])
+
+        pages += count[0]
+        found_emails += len(contacts & {("email", email) for email in site.emails})
+        found_phones += len(contacts & {("phone", phone) for phone in site.phones})
+        planted_emails += len(site.emails)
+        planted_phones += len(site.phones)
+
+    elapsed = time.perf_counter() - start
+
+    fetches.sort()
+
+    return {
+        "pages/s": pages / elapsed,
+        "fetches": pages,
+        "break reached": f"{reached}/{len(web.sites)}",
+        "median fetches to break": fetches[len(fetches) // 2] if fetches else None,
+        "email recall": found_emails / planted_emails,
+        "phone recall": found_phones / planted_phones,
+    }
+
+
+def bench_extractors(web):
+    from modules.enrich_leads.contact_extractor import extract_contacts
+    from modules.enrich_leads.html_parser import parse_html
+
+    # Every page of every site, rendered without the server
+    pages = [
+        (site.render(path), site.contacts[path])
+        for site in web.sites.values()
+        for path in site.paths
+    ]
+
+    planted = 0
+    found = 0
+    size = 0
+
+    start = time.perf_counter()
+
+    for html, (emails, phones) in pages:
+        page = parse_html(html)
+        page_emails, page_phones = extract_contacts(
+            page.text, [href for href, _, _ in page.links]
+        )
+
+        planted += len(emails) + len(phones)
+        found += len(set(emails) & set(page_emails)) + len(
+            set(phones) & set(page_phones)
+        )
+        size += len(html)
+
+    elapsed = time.perf_counter() - start
+
+    return {
+        "pages/s": len(pages) / elapsed,
+        "MB/s": size / elapsed / 1024 / 1024,
+        "recall": found / planted if planted else None,
+    }
+
+
+def print_results(name, results):
+    values = " | ".join(
+        f"{key} {value:.2f}" if isinstance(value, float) else f"{key} {value}"
+        for key, value in results.items()
+    )
+
+    print(f"{name:>10}: {values}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8899)
+    parser.add_argument("--workers", type=int, default=8)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    web = SyntheticWeb(args)
+    server = start_server(args)
+
+    sys.path.insert(0, REPO_ROOT)
+    workdir = prepare_workdir()
+
+    try:
+        from modules.utils import http_client
+
+        # Route every request to the synthetic web server
+        http_client.get_session().proxies = {"http": f"http://127.0.0.1:{args.port}"}
+
+        write_leads(web)
+        tracemalloc.start()
+
+        results = [
+            ("filter", bench_filter(web, args.workers)),
+            ("enrich", bench_enrich(web)),
+            ("extract", bench_extractors(web)),
+        ]
+
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        print()
+
+        for name, result in results:
+            print_results(name, result)
+
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+        print(
+            f"{'memory':>10}: peak traced {peak / 1024 / 1024:.1f} MB | max RSS {max_rss:.1f} MB"
+        )
+        print(f"{'output':>10}: {workdir}")
+    finally:
+        server.terminate()
@@ -0,0 +1,66 @@
+import time
+import argparse
+from benchmarks.corpus import load_pages
+from modules.enrich_leads.contact_extractor import extract_contacts
+from modules.enrich_leads.html_parser import (
+    available_backends,
+    get_parser,
+    parse_html_parser,
+)
+
+
+def run(parse, pages, rounds):
+    start = time.perf_counter()
+
+    for _ in range(rounds):
+        for html in pages:
+            parse(html)
+
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", default="data/pages")
+    parser.add_argument("--size", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    pages = load_pages(args.corpus, args.size)
+    total_bytes = sum(len(html.encode("utf-8")) for html in pages) * args.rounds
+    total_pages = len(pages) * args.rounds
+
+    # Reference output every backend is compared with
+    expected = [parse_html_parser(html) for html in pages]
+
+    for name in available_backends():
+        parse = get_parser(name)
+        elapsed = run(parse, pages, args.rounds)
+
+        # Same links and contacts should come out of every backend
+        links = 0
+        footer_links = 0
+        emails = 0
+        phones = 0
+        different = 0
+
+        for html, reference in zip(pages, expected):
+            page = parse(html)
+
+            if page.links != reference.links or (
+                page.text.split() != reference.text.split()
+            ):
+                different += 1
+
+            page_emails, page_phones = extract_contacts(
+                page.text, [href for href, _, _ in page.links]
+            )
+
+            links += len(page.links)
+            footer_links += sum(1 for _, _, in_footer in page.links if in_footer)
+            emails += len(page_emails)
+            phones += len(page_phones)
+
+        print(
+            f"{name:>12}: {total_pages / elapsed:8.1f} pages/s | {total_bytes / elapsed / 1024 / 1024:6.1f} MB/s | {links} links ({footer_links} footer) | {emails} emails | {phones} phones | {different} pages differ from html.parser"
+        )
@@ -0,0 +1,55 @@
+import os
+import random
+
+WORDS = ["fiets", "winkel", "bestel", "levering", "retour", "product", "prijs"]
+
+
+def synthetic_page(index):
+    # Shop-like page: navigation, product grid, footer with contact details
+    rng = random.Random(index)
+
+    navigation = "".join(
+        f"<li><a href='/collections/c{i}'>Categorie {i}</a></li>" for i in range(30)
+    )
+    products = "".join(
+        f"<div class='product'><a href='/products/p{index}-{i}'><img src='/img/p{i}@2x.png'>"
+        f"<h3>{' '.join(rng.choices(WORDS, k=4))}</h3></a><p>{' '.join(rng.choices(WORDS, k=60))}</p>"
+        f"<span class='price'>&euro; {rng.randint(5, 500)},95</span></div>"
+        for i in range(40)
+    )
+    footer = (
+        "<footer><a href='/pages/contact'>Contact</a> <a href='/pages/klantenservice'>Klantenservice</a>"
+        f"<p><!-- contact -->Mail ons op info{index}@shop{index}.nl of bel 020-123 45 {index % 100:02d}</p>"
+        f"<a href='tel:+31612345{index % 1000:03d}'>Bel</a></footer>"
+    )
+
+    # Every fifth shop only lists its service address in JSON-LD in the head
+    structured = (
+        "<script type='application/ld+json'>"
+        f'{{"@type": "Organization", "email": "service{index}@shop{index}.nl", '
+        f'"telephone": "+31 30 765 43 {index % 100:02d}"}}</script>'
+        if index % 5 == 0
+        else ""
+    )
+
+    return (
+        "<html><head><title>Shop</title><style>.product{color:red}</style>"
+        f"<script>var config = {{a: 1}};</script>{structured}</head><body>"
+        f"<nav><ul>{navigation}</ul></nav><main>{products}</main>{footer}</body></html>"
+    )
+
+
+def load_pages(directory, size):
+    pages = []
+
+    if directory and os.path.isdir(directory):
+        for file in sorted(os.listdir(directory)):
+            if file.endswith((".html", ".htm")):
+                with open(os.path.join(directory, file), "r", errors="ignore") as f:
+                    pages.append(f.read())
+
+    if not pages:
+        print(f"No saved pages found, using {size} synthetic pages")
+        pages = [synthetic_page(index) for index in range(size)]
+
+    return pages
@@ -0,0 +1,281 @@
+import time
+import random
+import argparse
+from urllib.parse import urlparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = [
+    "fiets",
+    "winkel",
+    "bestel",
+    "levering",
+    "retour",
+    "product",
+    "prijs",
+    "korting",
+    "gratis",
+    "verzending",
+    "kwaliteit",
+    "nieuw",
+]
+
+# Pages where the contact details of a shop are planted
+CONTACT_PATHS = [
+    "/pages/contact",
+    "/pages/klantenservice",
+    "/pages/over-ons",
+    "/pages/team",
+]
+
+PLATFORMS = ["Shopify", "Magento", "WooCommerce", None]
+
+PLATFORM_HEAD = {
+    "Shopify": "<link rel='preconnect' href='https://cdn.shopify.com'><script src='https://cdn.shopify.com/s/files/theme.js'></script>",
+    "Magento": "<script type='text/x-magento-init'>{}</script><script src='/static/version1/requirejs-config.js'></script>",
+    "WooCommerce": "<link rel='stylesheet' href='/wp-content/plugins/woocommerce/assets/css/woocommerce.css'>",
+    None: "<link rel='stylesheet' href='/assets/site.css'>",
+}
+
+PLATFORM_HEADERS = {
+    "Shopify": {"x-shopify-stage": "production"},
+    "Magento": {"X-Magento-Tags": "store"},
+}
+
+
+class SyntheticSite:
+    def __init__(self, index, config):
+        rng = random.Random(f"{config.seed}-{index}")
+
+        self.index = index
+        self.host = f"shop{index}.test"
+        self.platform = PLATFORMS[index % len(PLATFORMS)]
+        self.has_sitemap = rng.random() < config.sitemap_rate
+
+        catalog = [f"/collections/c{i}" for i in range(config.pages // 10)]
+        catalog += [f"/products/p{i}" for i in range(config.pages - len(catalog))]
+
+        self.paths = ["/"] + CONTACT_PATHS + catalog
+        self.links = {}
+
+        # Random link graph over the catalog, the footer links to the contact pages
+        for path in self.paths:
+            self.links[path] = rng.sample(catalog, min(config.links, len(catalog)))
+
+        self.emails = [
+            f"{name}@{self.host}"
+            for name in rng.sample(
+                [
+                    "info",
+                    "sales",
+                    "support",
+                    "service",
+                    "orders",
+                    "retour",
+                    "pers",
+                    "hr",
+                    "finance",
+                    "admin",
+                    "inkoop",
+                    "marketing",
+                    "contact",
+                    "klantenservice",
+                    "webshop",
+                    "jan",
+                    "piet",
+                    "kees",
+                    "anna",
+                    "sophie",
+                ],
+                config.emails,
+            )
+        ]
+        self.phones = sorted(
+            {
+                f"+31{rng.choice('1234579')}{rng.randint(10000000, 99999999)}"
+                for _ in range(config.phones)
+            }
+        )
+
+        # Most contacts on the contact pages, a few scattered over the catalog
+        self.contacts = {path: ([], []) for path in self.paths}
+
+        for position, email in enumerate(self.emails):
+            path = (
+                CONTACT_PATHS[position % len(CONTACT_PATHS)]
+                if position % 5
+                else rng.choice(catalog)
+            )
+            self.contacts[path][0].append(email)
+
+        for position, phone in enumerate(self.phones):
+            path = (
+                CONTACT_PATHS[position % len(CONTACT_PATHS)]
+                if position % 5
+                else rng.choice(catalog)
+            )
+            self.contacts[path][1].append(phone)
+
+    def format_phone(self, phone):
+        # Plant numbers in the notations shops use
+        national = "0" + phone[3:]
+        notation = int(phone[-1]) % 3
+
+        if notation == 0:
+            return f"{national[:3]}-{national[3:6]} {national[6:8]} {national[8:]}"
+        if notation == 1:
+            return f"+31 (0){phone[3:5]} {phone[5:]}"
+
+        return national
+
+    def render(self, path):
+        emails, phones = self.contacts[path]
+        rng = random.Random(f"{self.host}{path}")
+
+        body = [f"<p>{' '.join(rng.choices(WORDS, k=120))}</p>" for _ in range(8)]
+
+        for email in emails:
+            body.insert(rng.randrange(len(body)), f"<p>Mail ons: {email}</p>")
+
+        for phone in phones:
+            body.insert(
+                rng.randrange(len(body)),
+                f"<p>Bel ons op {self.format_phone(phone)}</p>",
+            )
+
+        links = "".join(
+            f"<li><a href='{link}'>{link.rsplit('/', 1)[-1]}</a></li>"
+            for link in self.links[path]
+        )
+        footer = "".join(
+            f"<a href='{contact_path}'>{contact_path.rsplit('/', 1)[-1].replace('-', ' ')}</a> "
+            for contact_path in CONTACT_PATHS
+        )
+
+        return (
+            f"<html><head><title>{self.host}</title>{PLATFORM_HEAD[self.platform]}</head>"
+            f"<body><nav><ul>{links}</ul></nav><main>{''.join(body)}</main>"
+            f"<footer>{footer}</footer></body></html>"
+        )
+
+    def robots(self):
+        if not self.has_sitemap:
+            return "User-agent: *\nDisallow: /cart\n"
+
+        return f"User-agent: *\nSitemap: http://{self.host}/sitemap.xml\n"
+
+    def sitemap(self):
+        urls = "".join(
+            f"<url><loc>http://{self.host}{path}</loc></url>" for path in self.paths
+        )
+
+        return f"<?xml version='1.0'?><urlset xmlns='http://www.sitemaps.org/schemas/sitemap/0.9'>{urls}</urlset>"
+
+
+class SyntheticWeb:
+    def __init__(self, config):
+        self.config = config
+        self.sites = {}
+
+        for index in range(config.sites):
+            site = SyntheticSite(index, config)
+            self.sites[site.host] = site
+
+    def leads(self):
+        return [
+            {
+                "product": "benchmark",
+                "company": f"Shop {site.index}",
+                "website": f"http://{site.host}/",
+            }
+            for site in self.sites.values()
+        ]
+
+
+class SyntheticServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients close connections early, e.g. after a platform marker
+        pass
+
+
+def make_handler(web):
+    config = web.config
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            # Requests arrive through the proxy setting with an absolute URL
+            url = urlparse(self.path)
+            host = url.netloc or self.headers.get("Host", "")
+            site = web.sites.get(host.split(":")[0])
+
+            if config.latency:
+                time.sleep(random.uniform(0.5, 1.5) * config.latency / 1000)
+
+            if site is None:
+                return self.reply(404, "Unknown host")
+
+            if random.random() < config.error_rate:
+                return self.reply(503, "Service unavailable")
+
+            path = url.path or "/"
+
+            if path == "/robots.txt":
+                return self.reply(200, site.robots(), "text/plain")
+
+            if path == "/sitemap.xml" and site.has_sitemap:
+                return self.reply(200, site.sitemap(), "application/xml")
+
+            if path not in site.contacts:
+                return self.reply(404, "Not found")
+
+            return self.reply(
+                200, site.render(path), headers=PLATFORM_HEADERS.get(site.platform, {})
+            )
+
+        def reply(
+            self, status, body, content_type="text/html; charset=utf-8", headers={}
+        ):
+            body = body if isinstance(body, bytes) else body.encode("utf-8")
+
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+
+            for key, value in headers.items():
+                self.send_header(key, value)
+
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def add_arguments(parser):
+    parser.add_argument("--sites", type=int, default=20)
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--links", type=int, default=30)
+    parser.add_argument("--emails", type=int, default=15)
+    parser.add_argument("--phones", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=20, help="milliseconds")
+    parser.add_argument("--error-rate", type=float, default=0.02)
+    parser.add_argument("--sitemap-rate", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8899)
+    add_arguments(parser)
+    config = parser.parse_args()
+
+    web = SyntheticWeb(config)
+    server = SyntheticServer(("127.0.0.1", config.port), make_handler(web))
+
+    print(f"Serving {len(web.sites)} synthetic shops on port {config.port}", flush=True)
+    server.serve_forever()
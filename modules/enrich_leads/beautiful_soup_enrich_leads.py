@@ -1,70 +1,68 @@
-import re
-import os
-import csv
+import json
+import time
+import asyncio
+import argparse
 import datetime
-import requests
+import itertools
+import multiprocessing
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlparse, urljoin
-from bs4 import BeautifulSoup
-
-EMAIL_REGEX = r"[a-z0-9\.\-+_]+@[a-z0-9\.\-+_]+\.[a-z]+"
-PHONE_REGEX = r"^((\+|00(\s|\s?\-\s?)?)31(\s|\s?\-\s?)?(\(0\)[\-\s]?)?|0)[1-9]((\s|\s?\-\s?)?[0-9])((\s|\s?-\s?)?[0-9])((\s|\s?-\s?)?[0-9])\s?[0-9]\s?[0-9]\s?[0-9]\s?[0-9]\s?[0-9]$"
-
-CONTACT_SUBSTRINGS = [
-    "contact",
-    "about",
-    "team",
-    "support",
-    "faq",
-    "help",
-    "getintouch",
-    "get-in-touch",
-    "klantenservice",
-    "press",
-    "terms",
-]
+from modules.enrich_leads.contact_extractor import extract_contacts
+from modules.enrich_leads.contact_frontier import ContactFrontier
+from modules.enrich_leads.sitemap_discovery import discover_contact_pages
+from modules.enrich_leads.template_detector import TemplateDetector
+from modules.enrich_leads.headless_fetcher import HeadlessFetcher, looks_js_rendered
+from modules.enrich_leads.html_parser import parse_html
+from modules.utils import http_client, metrics
+from modules.utils.result_writer import get_writer, flush_all
+from modules.utils.state_store import LEADS_BATCH_SIZE, get_store
+from modules.utils.work_queue import get_queue, run_worker
 
+# Maximum number of bytes read from a single response
+MAX_RESPONSE_BYTES = 5 * 1024 * 1024
 
-date_str = datetime.datetime.today().strftime("%Y-%m-%d")
-email_file_str = f"data/email_{date_str}.csv"
-phone_file_str = f"data/phone_{date_str}.csv"
-
-if not os.path.exists(email_file_str):
-    with open(email_file_str, "w") as data_file:
-        data_file.write("company,site,page,email\n")
+# Sitemap pages are queued above links found on the homepage
+SITEMAP_SCORE = 5
 
-if not os.path.exists(phone_file_str):
-    with open(phone_file_str, "w") as data_file:
-        data_file.write("company,site,page,phone\n")
+# Wall-clock seconds and bytes a single company may take, a crawl stops
+# fetching once either is used up
+COMPANY_TIME_BUDGET = 120
+COMPANY_BYTE_BUDGET = 20 * 1024 * 1024
 
+# Name of the shared queue that worker processes claim domains from
+WORK_QUEUE = "enrich"
 
-def log_status(company, message, pages_scanned, depth=0):
-    print(f"[{company}] {message} ({pages_scanned} pages scanned at depth {depth})")
+# Every site is crawled over this scheme, whatever the lead's URL says
+SCHEME = "https"
 
 
-def get_companies():
-    files = os.listdir("data")
+date_str = datetime.datetime.today().strftime("%Y-%m-%d")
+email_file_str = f"data/email_{date_str}.csv"
+phone_file_str = f"data/phone_{date_str}.csv"
 
-    companies = []
+email_writer = get_writer(email_file_str, ["company", "site", "page", "email"])
+phone_writer = get_writer(phone_file_str, ["company", "site", "page", "phone"])
 
-    for file in files:
-        if not file.startswith("leads_"):
-            continue
 
-        with open(f"data/{file}", "r") as f:
-            reader = csv.DictReader(f)
+def log_status(company, message, pages_scanned, depth=0):
+    metrics.event(
+        "enrich",
+        f"[{company}] {message} ({pages_scanned} pages scanned at depth {depth})",
+        company=company,
+        pages_scanned=pages_scanned,
+        depth=depth,
+    )
 
-            for row in reader:
-                companies.append(row)
 
-    if os.path.exists("data/history/enriched_leads.txt"):
-        with open("data/history/enriched_leads.txt", "r") as f:
-            enriched_leads = [line.strip() for line in f]
+def get_companies():
+    store = get_store()
 
-        companies = [
-            company for company in companies if company["company"] not in enriched_leads
-        ]
+    # Read the rows added to the leads files since the last run
+    store.import_leads_files()
 
-    return companies
+    # Stream the leads that have not been enriched yet
+    yield from store.unenriched_leads()
 
 
 def check_break_condition(total_emails, total_phone, base_url):
@@ -77,157 +75,474 @@ def check_break_condition(total_emails, total_phone, base_url):
     return len(domain_emails) > 12 and len(total_phone) > 6
 
 
-def scrape_website(website_url, company_name):
+class CrawlBudget:
+    # Time and bytes left for one company, the driver fetches every page
+    # (sitemaps included) before the deadline and counts what it received
+    def __init__(self, seconds=COMPANY_TIME_BUDGET, max_bytes=COMPANY_BYTE_BUDGET):
+        self.started = time.monotonic()
+        self.deadline = self.started + seconds
+        self.max_bytes = max_bytes
+        self.bytes_fetched = 0
+
+    def add(self, resp):
+        self.bytes_fetched += len(resp.content)
+
+    def exhausted(self):
+        return time.monotonic() >= self.deadline or self.bytes_fetched >= self.max_bytes
+
+
+def crawl_website(website_url, company_name, budget=None):
+    # Crawl loop without I/O, yields every URL to fetch and receives its
+    # response (or has the fetch exception thrown in) so that the same logic
+    # can be driven both synchronously and from the asyncio engine
     parsed_website_url = urlparse(website_url)
     start_url = parsed_website_url.netloc
 
     company = company_name
-    depth = 0
     pages_scanned = 0
+    budget = budget or CrawlBudget()
+
+    store = get_store()
+
+    # Most likely contact pages are fetched first, up to the page budget
+    frontier = ContactFrontier()
+    frontier.push(f"{SCHEME}://{start_url}")
+
+    # Seed the frontier with contact pages listed in robots.txt sitemaps
+    seeds = yield from discover_contact_pages(f"{SCHEME}://{start_url}")
+
+    for seed_url, score in seeds:
+        if start_url not in urlparse(seed_url).netloc:
+            continue
+
+        frontier.push(seed_url, depth=1, score=score + SITEMAP_SCORE)
 
-    sites_to_scrape = ["https://" + start_url]
+    log_status(
+        company=company,
+        message=f"Found {len(seeds)} contact pages in sitemaps",
+        pages_scanned=pages_scanned,
+    )
 
     total_emails = []
     total_phone = []
-    scrape_history = []
 
-    while depth < 3:
-        new_sites = []
+    # Catalog pages that repeat one template without contacts are skipped
+    templates = TemplateDetector()
+
+    while frontier:
+        site, depth = frontier.pop()
+
+        if templates.is_exhausted(site):
+            frontier.refund()
+            continue
+
+        # Slow or heavy shops do not hold up the rest of the leads
+        if budget.exhausted():
+            metrics.inc("budget_exhausted_total", stage="enrich")
+
+            log_status(
+                company=company,
+                message=f"Stopping after {time.monotonic() - budget.started:.0f} s and {budget.bytes_fetched // 1024} kB",
+                pages_scanned=pages_scanned,
+                depth=depth,
+            )
+            break
+
+        try:
+            resp = yield site
 
-        for site in sites_to_scrape:
-            scrape_history.append(site)
+            store.add_page(site, company, resp.status_code)
 
-            if start_url not in urlparse(site).netloc:
+            if resp.status_code != 200:
                 log_status(
                     company=company,
-                    message=f"Skipping external link {site}",
+                    message=f"Skipping status code {resp.status_code} {site}",
                     pages_scanned=pages_scanned,
                     depth=depth,
                 )
                 continue
 
-            try:
-                resp = requests.get(site, timeout=10)
-
-                if resp.status_code != 200:
-                    log_status(
-                        company=company,
-                        message=f"Skipping status code {resp.status_code} {site}",
-                        pages_scanned=pages_scanned,
-                        depth=depth,
-                    )
+            pages_scanned += 1
+
+            # Links and visible text in a single pass over the page
+            with metrics.timer("parse_seconds", stage="enrich"):
+                page = parse_html(resp.text)
+
+            hrefs = []
+
+            # Get new pages to scrape
+            for href, anchor_text, in_footer in page.links:
+                hrefs.append(href)
+
+                if (
+                    not href
+                    or href in ["#", "/", "javascript:void(0)"]
+                    or "mailto:" in href
+                ):
                     continue
 
-                pages_scanned += 1
+                new_site = urljoin(site, href).split("#")[0]
 
-                if (pages_scanned > 20 and depth > 1) or pages_scanned > 60:
-                    # Check URL more strictly to be contact page
-                    parsed_url = urlparse(site)
-                    path = parsed_url.path
+                # Skip external links
+                if start_url not in urlparse(new_site).netloc:
+                    continue
 
-                    # If URL does not contain any contact substrings, skip
-                    if (
-                        not any([substr in path for substr in CONTACT_SUBSTRINGS])
-                        or "stopcontact" in path.lower()
-                    ):
-                        log_status(
-                            company=company,
-                            message=f"Skipping non-contact page {site}",
-                            pages_scanned=pages_scanned,
-                            depth=depth,
-                        )
-                        continue
+                # Links in the footer of the page get a higher priority
+                frontier.push(
+                    new_site,
+                    depth=depth + 1,
+                    anchor_text=anchor_text,
+                    in_footer=in_footer,
+                )
 
-                soup = BeautifulSoup(resp.text, "html.parser")
+            # Get all text from the page
+            text = page.text
 
-                # Get new pages to scrape
-                for link in soup.find_all("a"):
-                    href = link.get("href")
+            if templates.is_duplicate(text):
+                continue
 
-                    if (
-                        not href
-                        or href in ["#", "/", "javascript:void(0)"]
-                        or "mailto:" in href
-                    ):
-                        continue
+            found_count = len(total_emails) + len(total_phone)
 
-                    if href.startswith("http"):
-                        new_site = href
-                    else:
-                        new_site = urljoin(start_url, href)
+            with metrics.timer("extract_seconds", stage="enrich"):
+                emails, phone_numbers = extract_contacts(text, hrefs)
 
-                    new_site = new_site.split("#")[0]
+            for email in emails:
+                if email in total_emails:
+                    continue
 
-                    if new_site in scrape_history:
-                        continue
+                total_emails.append(email)
 
-                    new_sites.append(new_site)
+                email_writer.write_row([company, start_url, site, email])
+                store.add_contact(company, "email", email, start_url, site)
 
-                # Get all text from the page
-                text = soup.get_text()
+            for phone in phone_numbers:
+                if phone in total_phone:
+                    continue
 
-                emails = list(set(re.findall(EMAIL_REGEX, text)))
+                total_phone.append(phone)
 
-                for email in emails:
-                    if email in total_emails:
-                        continue
+                phone_writer.write_row([company, start_url, site, phone])
+                store.add_contact(company, "phone", phone, start_url, site)
 
-                    total_emails.append(email)
+            templates.record(
+                site, text, len(total_emails) + len(total_phone) > found_count
+            )
 
-                    with open(email_file_str, "a") as data_file:
-                        data_file.write(f"{company},{start_url},{site},{email}\n")
+            log_status(
+                company=company,
+                message=f"Finished {site} | {len(total_emails)} email | {len(total_phone)} phone",
+                pages_scanned=pages_scanned,
+                depth=depth,
+            )
 
-                phone_numbers = list(set(re.findall(PHONE_REGEX, text)))
+            if check_break_condition(total_emails, total_phone, start_url):
+                break
+        except Exception as e:
+            metrics.count_exception("enrich", e)
+            continue
 
-                for phone in phone_numbers:
-                    if phone in total_phone:
-                        continue
+    metrics.inc("companies_total", stage="enrich")
+    metrics.observe("pages_per_company", pages_scanned, stage="enrich")
+    metrics.inc("contacts_total", len(total_emails), stage="enrich", kind="email")
+    metrics.inc("contacts_total", len(total_phone), stage="enrich", kind="phone")
+    metrics.inc("duplicate_urls_total", frontier.duplicates, stage="enrich")
+    metrics.inc("skipped_urls_total", frontier.skipped, stage="enrich")
+    metrics.inc("template_skips_total", templates.skipped_fetches(), stage="enrich")
+    metrics.inc("duplicate_pages_total", templates.duplicate_pages, stage="enrich")
 
-                    total_phone.append(phone)
+    if templates.skipped_fetches() or templates.duplicate_pages:
+        log_status(
+            company=company,
+            message=f"Saved {templates.skipped_fetches()} fetches of {', '.join(templates.exhausted_patterns())} and skipped {templates.duplicate_pages} duplicate pages",
+            pages_scanned=pages_scanned,
+        )
 
-                    with open(phone_file_str, "a") as data_file:
-                        data_file.write(f"{company},{start_url},{site},{phone}\n")
+    store.add_enriched_lead(company, website_url)
 
-                log_status(
-                    company=company,
-                    message=f"Finished {site} | {len(total_emails)} email | {len(total_phone)} phone",
-                    pages_scanned=pages_scanned,
-                    depth=depth,
-                )
 
-                if check_break_condition(total_emails, total_phone, start_url):
-                    return
+def fetch_page(url, deadline=None):
+    return http_client.get_capped(
+        url, MAX_RESPONSE_BYTES, timeout=10, deadline=deadline
+    )
+
+
+def fetch_page_hybrid(url, headless, deadline=None):
+    resp = fetch_page(url, deadline=deadline)
+
+    content_type = resp.headers.get("Content-Type", "")
+
+    if resp.status_code != 200 or "html" not in content_type:
+        return resp
+
+    # Only render pages in the browser when the static HTML is an empty shell
+    if not looks_js_rendered(resp.text):
+        return resp
+
+    try:
+        with metrics.timer("render_seconds", stage="enrich"):
+            return headless.fetch(url)
+    except Exception as e:
+        metrics.count_exception("render", e)
+        print(f"Error rendering {url}: {e}")
+        return resp
+
+
+def scrape_website(website_url, company_name, fetch=fetch_page):
+    budget = CrawlBudget()
+    crawler = crawl_website(website_url, company_name, budget)
+
+    try:
+        site = next(crawler)
+
+        while True:
+            try:
+                resp = fetch(site, deadline=budget.deadline)
             except Exception as e:
+                site = crawler.throw(e)
                 continue
 
-        if check_break_condition(total_emails, total_phone, start_url):
-            break
+            budget.add(resp)
+            site = crawler.send(resp)
+    except StopIteration:
+        pass
 
-        sites_to_scrape = list(set(new_sites))
-        depth += 1
 
-    with open("data/history/enriched_leads.txt", "a") as f:
-        f.write(f"{company}\n")
+async def scrape_website_async(website_url, company_name, limits):
+    budget = CrawlBudget()
+    crawler = crawl_website(website_url, company_name, budget)
 
+    try:
+        site = next(crawler)
+
+        while True:
+            try:
+                resp = await limits.fetch(site, budget.deadline)
+            except Exception as e:
+                site = crawler.throw(e)
+                continue
+
+            budget.add(resp)
+            site = crawler.send(resp)
+    except StopIteration:
+        pass
+
+
+class CrawlLimits:
+    def __init__(self, concurrency, per_host, fetch=fetch_page):
+        self.per_host = per_host
+        self.fetch_page = fetch
+        self.global_semaphore = asyncio.Semaphore(concurrency)
+        self.host_semaphores = {}
+
+        # Blocking requests run in a pool sized to the global limit
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+
+    def host_semaphore(self, url):
+        host = urlparse(url).netloc
+
+        if host not in self.host_semaphores:
+            self.host_semaphores[host] = asyncio.Semaphore(self.per_host)
+
+        return self.host_semaphores[host]
+
+    async def fetch(self, url, deadline=None):
+        loop = asyncio.get_running_loop()
+
+        async with self.host_semaphore(url):
+            async with self.global_semaphore:
+                with metrics.timer("fetch_seconds", stage="enrich"):
+                    return await loop.run_in_executor(
+                        self.executor, partial(self.fetch_page, url, deadline=deadline)
+                    )
+
+    def close(self):
+        self.executor.shutdown(wait=False)
 
-def enrich_leads():
-    # Create log file if it does not exist
-    if not os.path.exists("data/history/enriched_leads.txt"):
-        with open("data/history/enriched_leads.txt", "w") as f:
-            f.write("")
 
+def enrich_leads(fetch=fetch_page):
     companies = get_companies()
 
     for index, company in enumerate(companies):
         company_name = company["company"]
         website_url = company["website"]
 
-        scrape_website(website_url, company_name)
+        scrape_website(website_url, company_name, fetch)
 
         print(f"[{company_name}] Done! ({index + 1})")
 
+    http_client.log_connection_stats()
+    print("Done!")
+
+
+async def enrich_leads_async(concurrency=50, per_host=2, fetch=fetch_page):
+    # Workers take the next company from the stream when they are free
+    companies = enumerate(get_companies())
+
+    limits = CrawlLimits(concurrency, per_host, fetch)
+
+    async def worker():
+        while True:
+            index, company = next(companies, (None, None))
+
+            if company is None:
+                return
+
+            company_name = company["company"]
+            website_url = company["website"]
+
+            await scrape_website_async(website_url, company_name, limits)
+
+            print(f"[{company_name}] Done! ({index + 1})")
+
+    # Every worker crawls one company at a time, fetches share the limits
+    try:
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+    finally:
+        limits.close()
+
+    http_client.log_connection_stats()
+    print("Done!")
+
+
+def enqueue_companies(queue):
+    # Companies that were queued before keep their status
+    companies = get_companies()
+    count = 0
+
+    while True:
+        batch = [
+            (company["domain"], json.dumps([company["company"], company["website"]]))
+            for company in itertools.islice(companies, LEADS_BATCH_SIZE)
+        ]
+
+        if not batch:
+            break
+
+        queue.enqueue(batch)
+        count += len(batch)
+
+    print(f"Queued {count} leads")
+
+
+def enrich_leads_worker(queue_url=None, fetch=fetch_page, seed=True):
+    queue = get_queue(WORK_QUEUE, queue_url)
+
+    if seed:
+        enqueue_companies(queue)
+
+    def process(domain, payload):
+        company_name, website_url = json.loads(payload)
+
+        scrape_website(website_url, company_name, fetch)
+
+        print(f"[{company_name}] Done!")
+
+    processed = run_worker(queue, process)
+
+    http_client.log_connection_stats()
+    print(f"Done! ({processed} companies, queue {queue.counts()})")
+
+
+def run_worker_process(index, queue_url, hybrid, cache, hedge, metrics_args):
+    # Entry point of the processes started by --processes, spawned children
+    # start without the metrics and profiler of their parent
+    if metrics_args:
+        metrics.configure(metrics_args, worker=index)
+
+    if cache:
+        http_client.enable_cache()
+
+    if hedge:
+        http_client.enable_hedging()
+
+    headless = HeadlessFetcher() if hybrid else None
+    fetch = partial(fetch_page_hybrid, headless=headless) if headless else fetch_page
+
+    try:
+        enrich_leads_worker(queue_url, fetch, seed=False)
+    finally:
+        if headless:
+            headless.close()
+
+        # Child processes exit without running atexit handlers
+        flush_all()
+
+
+def enrich_leads_processes(
+    processes, queue_url=None, hybrid=False, cache=False, hedge=False, metrics_args=None
+):
+    enqueue_companies(get_queue(WORK_QUEUE, queue_url))
+
+    # Fresh interpreters, a forked SQLite connection or flusher is not safe
+    context = multiprocessing.get_context("spawn")
+
+    workers = [
+        context.Process(
+            target=run_worker_process,
+            args=(index, queue_url, hybrid, cache, hedge, metrics_args),
+        )
+        for index in range(processes)
+    ]
+
+    for worker in workers:
+        worker.start()
+
+    for worker in workers:
+        worker.join()
+
     print("Done!")
 
 
 if __name__ == "__main__":
-    enrich_leads()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--async", dest="use_async", action="store_true")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--per-host", type=int, default=2)
+    parser.add_argument("--hybrid", action="store_true")
+    parser.add_argument("--cache", action="store_true")
+    parser.add_argument("--hedge", action="store_true")
+    parser.add_argument("--worker", action="store_true")
+    parser.add_argument("--processes", type=int, default=0)
+    parser.add_argument(
+        "--queue-url", help="work queue served by modules.utils.work_queue"
+    )
+    metrics.add_arguments(parser)
+    args = parser.parse_args()
+
+    metrics.configure(args)
+
+    # Revalidate pages fetched on earlier runs instead of downloading them
+    if args.cache:
+        http_client.enable_cache()
+
+    # Send slow page requests a second time and use the first response
+    if args.hedge:
+        http_client.enable_hedging()
+
+    # Every process claims companies from the shared work queue
+    if args.processes:
+        enrich_leads_processes(
+            args.processes,
+            args.queue_url,
+            args.hybrid,
+            args.cache,
+            args.hedge,
+            metrics_args=args,
+        )
+        raise SystemExit
+
+    # Fetch with plain HTTP and fall back to a shared headless browser
+    headless = HeadlessFetcher() if args.hybrid else None
+    fetch = partial(fetch_page_hybrid, headless=headless) if headless else fetch_page
+
+    try:
+        if args.worker or args.queue_url:
+            enrich_leads_worker(args.queue_url, fetch)
+        elif args.use_async:
+            asyncio.run(enrich_leads_async(args.concurrency, args.per_host, fetch))
+        else:
+            enrich_leads(fetch)
+    finally:
+        if headless:
+            print(f"Rendered {headless.rendered} pages in the browser")
+            headless.close()
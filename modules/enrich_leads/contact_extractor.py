@@ -0,0 +1,151 @@
+import re
+import string
+from urllib.parse import unquote
+
+EMAIL_PATTERN = r"[a-z0-9._%+\-]+@[a-z0-9\-]+(?:\.[a-z0-9\-]+)*\.[a-z]{2,24}"
+
+# Characters allowed in the part of an email address before the @
+LOCAL_PART_CHARS = frozenset(string.ascii_letters + string.digits + "._%+-")
+MAX_LOCAL_PART = 64
+
+DOMAIN_PATTERN = r"[A-Za-z0-9\-]+(?:\.[A-Za-z0-9\-]+)*\.[A-Za-z]{2,24}(?![\w\-])"
+
+# Dutch numbers: +31, 0031 or a leading 0 followed by nine digits that may be
+# separated by spaces, dots or dashes, e.g. 020-123 45 67 or +31 (0)6 12345678
+NATIONAL_PATTERN = r"[1-9](?:\)?(?:\s?-\s?|[\s.])?\d){8}(?!\d)"
+COUNTRY_PATTERN = r"[\s\-]?31[\s\-]?(?:\(0\)[\s\-]?)?"
+TRUNK_COUNTRY_PATTERN = r"031[\s\-]?(?:\(0\)[\s\-]?)?"
+
+# Every match starts with one of @ + ( 0, which lets the regex engine skip
+# ahead to those characters, so the text is scanned only once for both
+# emails (the domain after the @) and phone numbers
+CONTACT_REGEX = re.compile(
+    r"[@+(0](?:"
+    rf"(?<=@)(?P<domain>{DOMAIN_PATTERN})"
+    r"|(?<![\w+].)(?P<phone>"
+    rf"(?<=\+){COUNTRY_PATTERN}{NATIONAL_PATTERN}"
+    rf"|(?<=0)(?:{TRUNK_COUNTRY_PATTERN})?{NATIONAL_PATTERN}"
+    rf"|(?<=\()0{NATIONAL_PATTERN}"
+    r"))"
+)
+
+EMAIL_REGEX = re.compile(EMAIL_PATTERN, re.IGNORECASE)
+
+# "Top level domains" of file names that look like email addresses,
+# e.g. logo@2x.png or icon@3x.webp
+ASSET_EXTENSIONS = {
+    "png",
+    "jpg",
+    "jpeg",
+    "gif",
+    "webp",
+    "svg",
+    "avif",
+    "ico",
+    "css",
+    "js",
+    "json",
+    "woff",
+    "woff2",
+    "ttf",
+    "mp4",
+    "pdf",
+}
+
+# Placeholder addresses used in forms and documentation
+PLACEHOLDER_EMAILS = [
+    "example.com",
+    "example.nl",
+    "domain.com",
+    "email.com",
+    "sentry.io",
+    "wixpress.com",
+]
+
+
+def clean_email(email):
+    email = email.strip(".").lower()
+    local, _, domain = email.rpartition("@")
+
+    if not local or not domain:
+        return None
+
+    if domain.rsplit(".", 1)[-1] in ASSET_EXTENSIONS:
+        return None
+
+    if any([domain.endswith(placeholder) for placeholder in PLACEHOLDER_EMAILS]):
+        return None
+
+    return email
+
+
+def normalize_phone(phone):
+    digits = re.sub(r"\D", "", phone.replace("(0)", ""))
+
+    # Rewrite international and national notations to E.164
+    if digits.startswith("0031"):
+        digits = digits[4:]
+    elif digits.startswith("31") and phone.lstrip().startswith("+"):
+        digits = digits[2:]
+    elif digits.startswith("0"):
+        digits = digits[1:]
+    else:
+        return None
+
+    if len(digits) != 9 or digits[0] == "0":
+        return None
+
+    return f"+31{digits}"
+
+
+def extract_contacts(text, hrefs=()):
+    emails = set()
+    phones = set()
+
+    for match in CONTACT_REGEX.finditer(text):
+        if match.lastgroup == "domain":
+            # Walk back from the @ to the start of the address
+            at = match.start()
+            start = at
+
+            while (
+                start > 0
+                and at - start < MAX_LOCAL_PART
+                and text[start - 1] in LOCAL_PART_CHARS
+            ):
+                start -= 1
+
+            email = clean_email(text[start : match.end()])
+
+            if email:
+                emails.add(email)
+        else:
+            phone = normalize_phone(match.group())
+
+            if phone:
+                phones.add(phone)
+
+    # Addresses and numbers that are only present in links
+    for href in hrefs:
+        if not href:
+            continue
+
+        scheme, _, value = href.strip().partition(":")
+        scheme = scheme.lower()
+
+        if scheme == "mailto":
+            value = unquote(value.split("?")[0])
+
+            for address in value.split(","):
+                if EMAIL_REGEX.fullmatch(address.strip()):
+                    email = clean_email(address.strip())
+
+                    if email:
+                        emails.add(email)
+        elif scheme == "tel":
+            phone = normalize_phone(unquote(value))
+
+            if phone:
+                phones.add(phone)
+
+    return sorted(emails), sorted(phones)
@@ -0,0 +1,170 @@
+import heapq
+from urllib.parse import urlparse
+from modules.enrich_leads.url_canonicalizer import canonical_url
+
+# Maximum number of pages fetched per website
+PAGE_BUDGET = 25
+
+# Pages deeper than this are never queued
+MAX_DEPTH = 3
+
+# Path substrings that indicate a page with contact details
+PATH_SCORES = {
+    "contact": 10,
+    "klantenservice": 10,
+    "getintouch": 9,
+    "get-in-touch": 9,
+    "over-ons": 7,
+    "overons": 7,
+    "about": 7,
+    "colofon": 7,
+    "impressum": 7,
+    "bedrijfsgegevens": 7,
+    "support": 5,
+    "service": 5,
+    "help": 4,
+    "faq": 4,
+    "team": 4,
+    "terms": 3,
+    "voorwaarden": 3,
+    "privacy": 3,
+    "retour": 2,
+    "verzend": 2,
+    "press": 2,
+}
+
+# Anchor texts that indicate a page with contact details
+ANCHOR_SCORES = {
+    "contact": 8,
+    "klantenservice": 8,
+    "neem contact op": 8,
+    "bereikbaarheid": 6,
+    "over ons": 6,
+    "about": 6,
+    "colofon": 6,
+    "customer service": 6,
+    "klantendienst": 6,
+    "openingstijden": 5,
+    "service": 3,
+    "help": 3,
+    "faq": 3,
+    "veelgestelde vragen": 3,
+    "voorwaarden": 2,
+    "privacy": 2,
+}
+
+# Path substrings of catalog pages that rarely contain contact details
+PATH_PENALTIES = {
+    "stopcontact": -15,
+    "/product": -6,
+    "/products": -6,
+    "/collections": -5,
+    "/categorie": -5,
+    "/category": -5,
+    "/shop/": -4,
+    "/p/": -4,
+    "/cart": -8,
+    "/winkelwagen": -8,
+    "/checkout": -8,
+    "/account": -8,
+    "/login": -8,
+    "/wishlist": -8,
+    "/search": -8,
+    "/zoeken": -8,
+    "/tag/": -4,
+    "/blog": -3,
+}
+
+FOOTER_SCORE = 4
+DEPTH_PENALTY = 2
+
+SKIPPED_EXTENSIONS = (
+    ".jpg",
+    ".jpeg",
+    ".png",
+    ".gif",
+    ".webp",
+    ".svg",
+    ".pdf",
+    ".zip",
+    ".css",
+    ".js",
+    ".xml",
+    ".mp4",
+)
+
+
+def score_url(url, anchor_text="", in_footer=False, depth=0):
+    path = urlparse(url).path.lower()
+    anchor_text = anchor_text.strip().lower()
+
+    score = 0
+
+    score += max([value for key, value in PATH_SCORES.items() if key in path] or [0])
+    score += max(
+        [value for key, value in ANCHOR_SCORES.items() if key in anchor_text] or [0]
+    )
+    score += sum([value for key, value in PATH_PENALTIES.items() if key in path])
+
+    # Contact links are usually grouped in the footer of every page
+    if in_footer:
+        score += FOOTER_SCORE
+
+    return score - depth * DEPTH_PENALTY
+
+
+class ContactFrontier:
+    def __init__(self, budget=PAGE_BUDGET, max_depth=MAX_DEPTH):
+        self.budget = budget
+        self.max_depth = max_depth
+        self.fetched = 0
+        self.queue = []
+        self.seen = set()
+        self.counter = 0
+        self.duplicates = 0
+        self.skipped = 0
+
+    def push(self, url, depth=0, anchor_text="", in_footer=False, score=None):
+        if depth >= self.max_depth:
+            return False
+
+        # Variants of a page share one canonical URL, so it is queued once
+        url = canonical_url(url)
+
+        if url is None:
+            self.skipped += 1
+            return False
+
+        if url in self.seen:
+            self.duplicates += 1
+            return False
+
+        if urlparse(url).path.lower().endswith(SKIPPED_EXTENSIONS):
+            return False
+
+        if score is None:
+            score = score_url(url, anchor_text, in_footer, depth)
+
+        self.seen.add(url)
+
+        # Counter keeps insertion order for equal scores
+        heapq.heappush(self.queue, (-score, self.counter, url, depth))
+        self.counter += 1
+
+        return True
+
+    def pop(self):
+        _, _, url, depth = heapq.heappop(self.queue)
+        self.fetched += 1
+
+        return url, depth
+
+    def refund(self):
+        # A popped page that was not fetched does not use up the budget
+        self.fetched -= 1
+
+    def __bool__(self):
+        return bool(self.queue) and self.fetched < self.budget
+
+    def __len__(self):
+        return len(self.queue)
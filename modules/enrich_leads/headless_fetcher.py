@@ -0,0 +1,132 @@
+import re
+import queue
+import threading
+from types import SimpleNamespace
+from concurrent.futures import Future
+from modules.utils import metrics
+from modules.utils.http_client import USER_AGENT
+
+# Pages with fewer anchors than this may be rendered client side
+MIN_ANCHORS = 3
+
+# Pages with less visible text than this may be rendered client side
+MIN_TEXT_LENGTH = 200
+
+# Mount points of common single page application frameworks
+SPA_MARKERS = [
+    'id="root"',
+    'id="app"',
+    'id="__next"',
+    'id="__nuxt"',
+    "ng-version",
+    "data-reactroot",
+    "data-server-rendered",
+]
+
+# Milliseconds to wait for a page to load in the browser
+NAVIGATION_TIMEOUT = 15000
+SETTLE_TIMEOUT = 3000
+
+SCRIPT_STYLE_REGEX = re.compile(r"<(script|style)\b.*?</\1\s*>", re.S | re.I)
+TAG_REGEX = re.compile(r"<[^>]+>")
+
+
+def looks_js_rendered(html):
+    lowered = html.lower()
+
+    if lowered.count("<a ") >= MIN_ANCHORS:
+        return False
+
+    # Empty SPA shell without any links
+    if any([marker in lowered for marker in SPA_MARKERS]):
+        return True
+
+    text = TAG_REGEX.sub(" ", SCRIPT_STYLE_REGEX.sub(" ", html))
+
+    return len(" ".join(text.split())) < MIN_TEXT_LENGTH
+
+
+class HeadlessFetcher:
+    # Playwright's sync API is bound to the thread that started it, so one
+    # thread owns the browser and renders the pages handed to it by others
+    def __init__(self):
+        self.rendered = 0
+        self.jobs = queue.Queue()
+        self.thread = threading.Thread(
+            target=self.run, name="headless-fetcher", daemon=True
+        )
+        self.thread.start()
+
+    def run(self):
+        try:
+            from playwright.sync_api import sync_playwright
+
+            with sync_playwright() as p:
+                browser = p.chromium.launch(headless=True)
+                context = browser.new_context(user_agent=USER_AGENT, locale="nl-NL")
+                page = context.new_page()
+
+                self.serve(page)
+
+                browser.close()
+        except Exception as e:
+            # Without a browser every render fails so callers keep static HTML
+            print(f"Error starting headless browser: {e}")
+
+            while True:
+                job = self.jobs.get()
+
+                if job is None:
+                    break
+
+                job[1].set_exception(e)
+
+    def serve(self, page):
+        while True:
+            job = self.jobs.get()
+
+            if job is None:
+                break
+
+            url, future = job
+
+            try:
+                future.set_result(self.render(page, url))
+                self.rendered += 1
+            except Exception as e:
+                future.set_exception(e)
+
+    def render(self, page, url):
+        response = page.goto(
+            url, wait_until="domcontentloaded", timeout=NAVIGATION_TIMEOUT
+        )
+
+        # Give client side rendering a bounded amount of time to finish
+        try:
+            page.wait_for_load_state("networkidle", timeout=SETTLE_TIMEOUT)
+        except Exception:
+            pass
+
+        html = page.content()
+
+        return SimpleNamespace(
+            url=page.url,
+            status_code=response.status if response else 200,
+            headers={"Content-Type": "text/html"},
+            text=html,
+            content=html.encode("utf-8"),
+            truncated=False,
+            rendered=True,
+        )
+
+    def fetch(self, url):
+        future = Future()
+        self.jobs.put((url, future))
+
+        metrics.set_gauge("queue_depth", self.jobs.qsize(), queue="headless")
+
+        return future.result()
+
+    def close(self):
+        self.jobs.put(None)
+        self.thread.join()
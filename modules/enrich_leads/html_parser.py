@@ -0,0 +1,279 @@
+from collections import namedtuple
+from html.parser import HTMLParser
+
+# Every backend returns the links as (href, anchor text, in footer) tuples and
+# the visible text of the page, collected in a single walk over the document
+ParsedPage = namedtuple("ParsedPage", ["links", "text"])
+
+# Elements whose text is never visible
+SKIPPED_TAGS = {"script", "style", "noscript", "template", "svg"}
+
+# Elements that never have a closing tag
+VOID_TAGS = {
+    "area",
+    "base",
+    "br",
+    "col",
+    "embed",
+    "hr",
+    "img",
+    "input",
+    "link",
+    "meta",
+    "param",
+    "source",
+    "track",
+    "wbr",
+}
+
+
+def is_footer(tag, attributes):
+    if tag == "footer":
+        return True
+
+    for name in ["id", "class"]:
+        value = attributes.get(name)
+
+        if value and "footer" in value.lower():
+            return True
+
+    return False
+
+
+def is_structured_data(tag, attributes):
+    # JSON-LD blocks often hold the shop's email address and phone number
+    return tag == "script" and attributes.get("type") == "application/ld+json"
+
+
+class StreamingParser(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+
+        self.links = []
+        self.text = []
+        self.stack = []
+        self.footer_depth = 0
+        self.skip_depth = 0
+        self.anchor = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag in VOID_TAGS:
+            return
+
+        attributes = dict(attrs)
+
+        footer = is_footer(tag, attributes)
+        skip = tag in SKIPPED_TAGS and not is_structured_data(tag, attributes)
+
+        self.stack.append((tag, footer, skip))
+        self.footer_depth += footer
+        self.skip_depth += skip
+
+        if tag == "a":
+            self.close_anchor()
+            self.anchor = [attributes.get("href"), [], self.footer_depth > 0]
+
+    def handle_endtag(self, tag):
+        if not any([open_tag == tag for open_tag, _, _ in self.stack]):
+            return
+
+        # Close every element left open inside this one
+        while self.stack:
+            open_tag, footer, skip = self.stack.pop()
+
+            self.footer_depth -= footer
+            self.skip_depth -= skip
+
+            if open_tag == "a":
+                self.close_anchor()
+
+            if open_tag == tag:
+                break
+
+    def handle_data(self, data):
+        if self.skip_depth:
+            return
+
+        self.text.append(data)
+
+        if self.anchor is not None:
+            self.anchor[1].append(data)
+
+    def close_anchor(self):
+        if self.anchor is None:
+            return
+
+        href, text, in_footer = self.anchor
+        self.links.append((href, " ".join(" ".join(text).split()), in_footer))
+        self.anchor = None
+
+
+def parse_html_parser(html):
+    parser = StreamingParser()
+    parser.feed(html)
+    parser.close()
+    parser.close_anchor()
+
+    return ParsedPage(parser.links, " ".join(parser.text))
+
+
+def parse_lxml(html):
+    from lxml import etree, html as lxml_html
+
+    try:
+        root = lxml_html.document_fromstring(html)
+    except (etree.ParserError, ValueError):
+        return parse_html_parser(html)
+
+    links = []
+    text = []
+    anchors = []
+    footer_depth = 0
+    skip_depth = 0
+
+    def add_text(value):
+        text.append(value)
+
+        for anchor in anchors:
+            anchor[1].append(value)
+
+    # Comments and processing instructions only have their own events, but
+    # the text after them belongs to the page
+    for event, element in etree.iterwalk(
+        root, events=("start", "end", "comment", "pi")
+    ):
+        if event in ["comment", "pi"]:
+            if element.tail and not skip_depth:
+                add_text(element.tail)
+
+            continue
+
+        tag = element.tag if isinstance(element.tag, str) else ""
+
+        if event == "start":
+            footer = is_footer(tag, element.attrib)
+            skip = tag in SKIPPED_TAGS and not is_structured_data(tag, element.attrib)
+
+            footer_depth += footer
+            skip_depth += skip
+
+            if tag == "a":
+                anchors.append([element.get("href"), [], footer_depth > 0])
+
+            if element.text and not skip_depth and tag:
+                add_text(element.text)
+
+            continue
+
+        footer_depth -= is_footer(tag, element.attrib)
+        skip_depth -= tag in SKIPPED_TAGS and not is_structured_data(
+            tag, element.attrib
+        )
+
+        if tag == "a" and anchors:
+            href, anchor_text, in_footer = anchors.pop()
+            links.append((href, " ".join(" ".join(anchor_text).split()), in_footer))
+
+        # Text after the closing tag belongs to the parent element
+        if element.tail and not skip_depth:
+            add_text(element.tail)
+
+    return ParsedPage(links, " ".join(text))
+
+
+def parse_selectolax(html):
+    from selectolax.lexbor import LexborHTMLParser
+
+    tree = LexborHTMLParser(html)
+
+    for node in tree.css(", ".join(SKIPPED_TAGS)):
+        if not is_structured_data(node.tag, node.attributes):
+            node.decompose()
+
+    footer_links = set()
+
+    for footer in tree.css("footer, [id*=footer], [class*=footer]"):
+        footer_links.update(link.mem_id for link in footer.css("a"))
+
+    links = [
+        (
+            link.attributes.get("href"),
+            link.text(separator=" ", strip=True),
+            link.mem_id in footer_links,
+        )
+        for link in tree.css("a")
+    ]
+
+    # The whole document, JSON-LD in the head holds contact details too
+    root = tree.root
+    text = root.text(separator=" ") if root else ""
+
+    return ParsedPage(links, text)
+
+
+def parse_bs4(html):
+    from bs4 import BeautifulSoup
+    from bs4.element import CData, NavigableString, Script
+
+    soup = BeautifulSoup(html, "html.parser")
+
+    for node in soup.find_all(list(SKIPPED_TAGS)):
+        if not is_structured_data(node.name, node.attrs):
+            node.decompose()
+
+    footer_links = set()
+
+    for footer in soup.select("footer, [id*=footer], [class*=footer]"):
+        footer_links.update(id(link) for link in footer.find_all("a"))
+
+    links = [
+        (
+            link.get("href"),
+            link.get_text(" ", strip=True),
+            id(link) in footer_links,
+        )
+        for link in soup.find_all("a")
+    ]
+
+    # get_text leaves out script contents unless they are asked for, only the
+    # JSON-LD scripts are left at this point
+    text = soup.get_text(" ", types=(NavigableString, CData, Script))
+
+    return ParsedPage(links, text)
+
+
+BACKENDS = {
+    "selectolax": parse_selectolax,
+    "lxml": parse_lxml,
+    "html.parser": parse_html_parser,
+    "bs4": parse_bs4,
+}
+
+
+def available_backends():
+    backends = []
+
+    for name in BACKENDS:
+        module = {"selectolax": "selectolax.lexbor", "lxml": "lxml.html"}.get(name)
+
+        try:
+            if module:
+                __import__(module)
+        except ImportError:
+            continue
+
+        backends.append(name)
+
+    return backends
+
+
+# Fastest backend that is installed, html.parser needs no extra packages
+DEFAULT_BACKEND = available_backends()[0]
+
+
+def get_parser(name=None):
+    return BACKENDS[name or DEFAULT_BACKEND]
+
+
+def parse_html(html, backend=None):
+    return get_parser(backend)(html)
@@ -1,11 +1,12 @@
 import datetime
-import re
+import argparse
 import csv
 from urllib.parse import urlparse
-from playwright.sync_api import sync_playwright
-
-EMAIL_REGEX = r"[a-z0-9\.\-+_]+@[a-z0-9\.\-+_]+\.[a-z]+"
-PHONE_REGEX = r"^((\+|00(\s|\s?\-\s?)?)31(\s|\s?\-\s?)?(\(0\)[\-\s]?)?|0)[1-9]((\s|\s?\-\s?)?[0-9])((\s|\s?-\s?)?[0-9])((\s|\s?-\s?)?[0-9])\s?[0-9]\s?[0-9]\s?[0-9]\s?[0-9]\s?[0-9]$"
+from modules.enrich_leads.contact_extractor import extract_contacts
+from modules.utils import metrics
+from modules.utils.browser_pool import BrowserPool
+from modules.utils.domains import registrable_domain
+from modules.utils.result_writer import get_writer
 
 CONTACT_SUBSTRINGS = [
     "contact",
@@ -22,16 +23,57 @@ CONTACT_SUBSTRINGS = [
 ]
 
 
+# Resource types that are never needed to find links and contact details
+BLOCKED_RESOURCE_TYPES = [
+    "image",
+    "media",
+    "font",
+    "stylesheet",
+    "texttrack",
+    "eventsource",
+    "websocket",
+    "manifest",
+    "other",
+]
+
+# Analytics, advertising and chat widgets loaded by most webshops
+BLOCKED_DOMAINS = [
+    "google-analytics.com",
+    "googletagmanager.com",
+    "doubleclick.net",
+    "facebook.net",
+    "connect.facebook.net",
+    "hotjar.com",
+    "clarity.ms",
+    "bing.com",
+    "tiktok.com",
+    "pinterest.com",
+    "trustpilot.com",
+    "kiyoh.com",
+    "klaviyo.com",
+    "zendesk.com",
+    "intercom.io",
+    "cookiebot.com",
+]
+
+# Milliseconds to wait for a page in fast mode
+NAVIGATION_TIMEOUT = 15000
+SETTLE_TIMEOUT = 1500
+
+# Collect every href and the body text in a single round trip
+EXTRACT_SCRIPT = """() => [
+    Array.from(document.querySelectorAll("a"), (a) => a.getAttribute("href")),
+    document.body ? document.body.innerText : "",
+]"""
+
+
 date_str = datetime.datetime.today().strftime("%Y-%m-%d")
 email_file_str = f"data/email_{date_str}.csv"
 phone_file_str = f"data/phone_{date_str}.csv"
 
 
-with open(email_file_str, "w") as data_file:
-    data_file.write("company,site,page,email\n")
-
-with open(phone_file_str, "w") as data_file:
-    data_file.write("company,site,page,phone\n")
+email_writer = get_writer(email_file_str, ["company", "site", "page", "email"])
+phone_writer = get_writer(phone_file_str, ["company", "site", "page", "phone"])
 
 
 def check_break_condition(total_emails, total_phone, base_url):
@@ -44,7 +86,58 @@ def check_break_condition(total_emails, total_phone, base_url):
     return len(domain_emails) > 12 and len(total_phone) > 6
 
 
-def scrape_website(page, website_url, company_name):
+def is_blocked_host(url):
+    host = urlparse(url).hostname or ""
+
+    return any(
+        [host == domain or host.endswith(f".{domain}") for domain in BLOCKED_DOMAINS]
+    )
+
+
+def block_resources(route):
+    request = route.request
+
+    # The page itself is always loaded, whatever its host
+    if request.resource_type == "document":
+        route.continue_()
+    elif request.resource_type in BLOCKED_RESOURCE_TYPES or is_blocked_host(
+        request.url
+    ):
+        route.abort()
+    else:
+        route.continue_()
+
+
+def enable_fast_mode(page):
+    page.route("**/*", block_resources)
+
+
+def load_page(page, site, fast=False):
+    if not fast:
+        page.goto(site)
+        page.wait_for_load_state("networkidle")
+
+        links = page.query_selector_all("a")
+
+        hrefs = [link.get_attribute("href") for link in links]
+        text = page.inner_text("body")
+
+        return hrefs, text
+
+    page.goto(site, wait_until="domcontentloaded", timeout=NAVIGATION_TIMEOUT)
+
+    # Short bounded settle time for scripts that inject links
+    try:
+        page.wait_for_load_state("networkidle", timeout=SETTLE_TIMEOUT)
+    except Exception:
+        pass
+
+    hrefs, text = page.evaluate(EXTRACT_SCRIPT)
+
+    return hrefs, text
+
+
+def scrape_website(page, website_url, company_name, fast=False):
     start_url = website_url
     company = company_name
 
@@ -90,23 +183,22 @@ def scrape_website(page, website_url, company_name):
                 ):
                     continue
 
-            print(f"[{company}] Scraping {site} at depth {depth}")
-            print(
-                f"[{company}] Found {len(total_emails)} emails and {len(total_phone)} phone numbers"
+            metrics.event(
+                "enrich",
+                f"[{company}] Scraping {site} at depth {depth} | {len(total_emails)} email | {len(total_phone)} phone",
+                company=company,
+                pages_scanned=pages_scanned,
+                depth=depth,
             )
 
             try:
-                page.goto(site)
-                page.wait_for_load_state("networkidle")
+                with metrics.timer("load_seconds", stage="enrich"):
+                    hrefs, text = load_page(page, site, fast)
 
                 pages_scanned += 1
 
-                links = page.query_selector_all("a")
-
                 # For all links on the page
-                for link in links:
-                    href = link.get_attribute("href")
-
+                for href in hrefs:
                     if (
                         not href
                         or href == "#"
@@ -136,13 +228,9 @@ def scrape_website(page, website_url, company_name):
 
                         new_sites.append(new_site)
 
-                # Find all emails
-                text = page.inner_text("body")
-
-                emails = re.findall(EMAIL_REGEX, text)
-
-                # Filter out duplicates
-                emails = list(set(emails))
+                # Find all emails and Dutch phone numbers in one pass
+                with metrics.timer("extract_seconds", stage="enrich"):
+                    emails, phone_numbers = extract_contacts(text, hrefs)
 
                 for email in emails:
                     if email in total_emails:
@@ -150,14 +238,7 @@ def scrape_website(page, website_url, company_name):
 
                     total_emails.append(email)
 
-                    with open(email_file_str, "a") as data_file:
-                        data_file.write(f"{company},{start_url},{site},{email}\n")
-
-                # Find all Dutch phone numbers
-                phone_numbers = re.findall(PHONE_REGEX, text)
-
-                # Filter out duplicates
-                phone_numbers = list(set(phone_numbers))
+                    email_writer.write_row([company, start_url, site, email])
 
                 for phone in phone_numbers:
                     if phone in total_phone:
@@ -165,13 +246,13 @@ def scrape_website(page, website_url, company_name):
 
                     total_phone.append(phone)
 
-                    with open(phone_file_str, "a") as data_file:
-                        data_file.write(f"{company},{start_url},{site},{phone}\n")
+                    phone_writer.write_row([company, start_url, site, phone])
 
                 # If total emails and phone numbers are more than 100, stop scraping
                 if check_break_condition(total_emails, total_phone, start_url):
                     break
             except Exception as e:
+                metrics.count_exception("enrich", e)
                 continue
 
         sites_to_scrape = list(set(new_sites))
@@ -182,24 +263,49 @@ def scrape_website(page, website_url, company_name):
 
         depth += 1
 
+    metrics.inc("companies_total", stage="enrich")
+    metrics.observe("pages_per_company", pages_scanned, stage="enrich")
+    metrics.inc("contacts_total", len(total_emails), stage="enrich", kind="email")
+    metrics.inc("contacts_total", len(total_phone), stage="enrich", kind="phone")
+
 
 if __name__ == "__main__":
-    companies = csv.DictReader(open("data/lead-list.csv"))
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fast", action="store_true")
+    parser.add_argument("--workers", type=int, default=4)
+    metrics.add_arguments(parser)
+    args = parser.parse_args()
+
+    metrics.configure(args)
+
+    companies = []
+    domains = set()
+
+    # Crawl every shop once, whatever URL variant the list has for it
+    for company in csv.DictReader(open("data/lead-list.csv")):
+        domain = registrable_domain(company["Website"])
+
+        if domain in domains:
+            continue
+
+        domains.add(domain)
+        companies.append(company)
+
+    def scrape_company(page, task):
+        index, company = task
+
+        company_name = company["Company"]
+        website_url = company["Website"]
 
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=True)
-        context = browser.new_context(
-            user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/132.0.0.0 Safari/537.36",
-            locale="nl-NL",
-        )
-        page = browser.new_page()
+        scrape_website(page, website_url, company_name, args.fast)
 
-        for index, company in enumerate(companies):
-            company_name = company["Company"]
-            website_url = company["Website"]
+        print(f"[{company_name}] Done! ({index + 1})")
 
-            scrape_website(page, website_url, company_name)
+    # Block non-document resources and skip waiting for network idle
+    pool = BrowserPool(
+        size=args.workers, setup_page=enable_fast_mode if args.fast else None
+    )
 
-            print(f"[{company_name}] Done! ({index + 1})")
+    pool.map(scrape_company, enumerate(companies))
 
     print("Done!")
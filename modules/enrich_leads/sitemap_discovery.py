@@ -0,0 +1,158 @@
+import zlib
+from urllib.parse import urljoin, urlparse
+from xml.etree.ElementTree import XMLPullParser, ParseError
+from modules.enrich_leads.contact_frontier import score_url
+
+# Sitemap locations tried when robots.txt does not list any
+DEFAULT_SITEMAP_PATHS = [
+    "/sitemap.xml",
+    "/sitemap_index.xml",
+    "/pub/sitemap.xml",
+]
+
+# Maximum number of sitemap files fetched per website
+MAX_SITEMAPS = 4
+
+# Maximum number of bytes read from a (decompressed) sitemap
+MAX_SITEMAP_BYTES = 5 * 1024 * 1024
+
+# Minimum contact score for a sitemap URL to be queued
+MIN_SEED_SCORE = 5
+
+# Maximum number of contact pages taken from the sitemaps
+MAX_SEEDS = 10
+
+# Child sitemaps of Shopify, WooCommerce (Yoast) and Magento indexes that
+# list CMS pages, and those that only list catalog entries
+PREFERRED_SITEMAPS = ["page", "cms", "pages"]
+IGNORED_SITEMAPS = [
+    "product",
+    "collection",
+    "categor",
+    "blog",
+    "post",
+    "tag",
+    "image",
+    "author",
+]
+
+
+def parse_robots(text):
+    sitemaps = []
+
+    for line in text.splitlines():
+        key, _, value = line.partition(":")
+
+        if key.strip().lower() == "sitemap" and value.strip():
+            sitemaps.append(value.strip())
+
+    return sitemaps
+
+
+def parse_sitemap(content):
+    # Sitemaps may be served gzipped without a Content-Encoding header
+    if content[:2] == b"\x1f\x8b":
+        content = zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(
+            content, MAX_SITEMAP_BYTES
+        )
+
+    parser = XMLPullParser(events=("start", "end"))
+
+    root_tag = None
+    child_sitemaps = []
+    page_urls = []
+
+    try:
+        parser.feed(content[:MAX_SITEMAP_BYTES])
+    except ParseError:
+        # Truncated or broken documents still yield the elements parsed so far
+        pass
+
+    for event, element in parser.read_events():
+        tag = element.tag.rsplit("}", 1)[-1]
+
+        if event == "start":
+            if root_tag is None:
+                root_tag = tag
+
+            continue
+
+        if tag != "loc" or not element.text:
+            continue
+
+        if root_tag == "sitemapindex":
+            child_sitemaps.append(element.text.strip())
+        else:
+            page_urls.append(element.text.strip())
+
+    return child_sitemaps, page_urls
+
+
+def rank_child_sitemaps(urls):
+    ranked = []
+
+    for url in urls:
+        name = urlparse(url).path.lower().rsplit("/", 1)[-1]
+
+        if any([preferred in name for preferred in PREFERRED_SITEMAPS]):
+            ranked.append((0, url))
+        elif not any([ignored in name for ignored in IGNORED_SITEMAPS]):
+            ranked.append((1, url))
+
+    return [url for _, url in sorted(ranked)]
+
+
+def discover_contact_pages(base_url):
+    # Generator used with "yield from" inside the crawl loop: yields the URLs
+    # to fetch, receives their responses and returns (url, score) seeds
+    sitemaps = []
+
+    try:
+        resp = yield urljoin(base_url, "/robots.txt")
+
+        if resp.status_code == 200:
+            sitemaps = parse_robots(resp.text)
+    except Exception:
+        pass
+
+    using_defaults = not sitemaps
+
+    if using_defaults:
+        sitemaps = [urljoin(base_url, path) for path in DEFAULT_SITEMAP_PATHS]
+
+    seeds = {}
+    fetched = 0
+
+    while sitemaps and fetched < MAX_SITEMAPS:
+        sitemap_url = sitemaps.pop(0)
+        fetched += 1
+
+        try:
+            resp = yield sitemap_url
+
+            if resp.status_code != 200:
+                continue
+
+            child_sitemaps, page_urls = parse_sitemap(resp.content)
+        except Exception:
+            continue
+
+        if not child_sitemaps and not page_urls:
+            continue
+
+        # Only the first default location that works is used
+        if using_defaults:
+            sitemaps = []
+            using_defaults = False
+
+        sitemaps = rank_child_sitemaps(child_sitemaps) + sitemaps
+
+        for url in page_urls:
+            score = score_url(url)
+
+            if score >= MIN_SEED_SCORE:
+                seeds[url] = max(score, seeds.get(url, score))
+
+    ranked = sorted(seeds.items(), key=lambda item: item[1], reverse=True)
+
+    return ranked[:MAX_SEEDS]
@@ -0,0 +1,135 @@
+import re
+import hashlib
+from collections import Counter
+from urllib.parse import urlparse
+from modules.enrich_leads.contact_frontier import score_url
+
+# Fingerprints that differ in at most this many of their 64 bits belong to
+# pages built from the same template
+NEAR_DUPLICATE_BITS = 10
+
+# Pages of a path pattern scanned without new contacts before the remaining
+# pages of that pattern are skipped
+TEMPLATE_PAGES = 5
+
+FINGERPRINT_BITS = 64
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def simhash(text):
+    # Every word votes on every bit with its count, pages that share most of
+    # their text (header, footer, menus) end up with nearly the same hash
+    words = Counter(WORD_PATTERN.findall(text.lower()))
+    votes = [0] * FINGERPRINT_BITS
+
+    for word, count in words.items():
+        digest = hashlib.blake2b(word.encode(), digest_size=8).digest()
+        value = int.from_bytes(digest, "big")
+
+        for bit in range(FINGERPRINT_BITS):
+            votes[bit] += count if value >> bit & 1 else -count
+
+    return sum([1 << bit for bit, vote in enumerate(votes) if vote > 0])
+
+
+def distance(first, second):
+    return bin(first ^ second).count("1")
+
+
+def path_pattern(url):
+    # /products/blue-shirt and /products/red-shirt share /products/*, pages
+    # directly under the root have no pattern and are never skipped
+    parsed = urlparse(url)
+    segments = [segment for segment in parsed.path.split("/") if segment]
+
+    if len(segments) < 2:
+        return None
+
+    pattern = [segments[0]]
+    pattern += [
+        "*" if any([char.isdigit() for char in segment]) else segment
+        for segment in segments[1:-1]
+    ]
+    pattern.append("*")
+
+    if parsed.query:
+        names = sorted({param.split("=")[0] for param in parsed.query.split("&")})
+        return "/" + "/".join(pattern) + "?" + "&".join(names)
+
+    return "/" + "/".join(pattern)
+
+
+class TemplatePattern:
+    def __init__(self):
+        self.fingerprints = []
+        self.productive = False
+        self.exhausted = False
+        self.skipped = 0
+
+
+class TemplateDetector:
+    # Learns per site which path patterns are one template repeated over the
+    # catalog without contact details, so the rest of them is not fetched
+    def __init__(self):
+        self.patterns = {}
+        self.digests = set()
+        self.duplicate_pages = 0
+
+    def is_exhausted(self, url):
+        pattern = self.patterns.get(path_pattern(url))
+
+        # Likely contact pages are always fetched
+        if pattern is None or not pattern.exhausted or score_url(url) > 0:
+            return False
+
+        pattern.skipped += 1
+
+        return True
+
+    def is_duplicate(self, text):
+        # The exact same text under another URL has nothing new to extract
+        digest = hashlib.blake2b(text.encode(), digest_size=16).digest()
+
+        if digest in self.digests:
+            self.duplicate_pages += 1
+            return True
+
+        self.digests.add(digest)
+
+        return False
+
+    def record(self, url, text, found_contacts):
+        key = path_pattern(url)
+
+        if key is None:
+            return
+
+        pattern = self.patterns.setdefault(key, TemplatePattern())
+
+        if found_contacts:
+            pattern.productive = True
+
+        if pattern.productive or pattern.exhausted:
+            return
+
+        pattern.fingerprints.append(simhash(text))
+
+        if len(pattern.fingerprints) < TEMPLATE_PAGES:
+            return
+
+        # The last few pages of the pattern all look like the first of those
+        first, *others = pattern.fingerprints[-TEMPLATE_PAGES:]
+
+        pattern.exhausted = all(
+            [
+                distance(first, fingerprint) <= NEAR_DUPLICATE_BITS
+                for fingerprint in others
+            ]
+        )
+
+    def exhausted_patterns(self):
+        return [key for key, pattern in self.patterns.items() if pattern.exhausted]
+
+    def skipped_fetches(self):
+        return sum([pattern.skipped for pattern in self.patterns.values()])
@@ -0,0 +1,179 @@
+import re
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# Query parameters that only track where a visitor came from
+TRACKING_PARAMS = {
+    "gclid",
+    "gbraid",
+    "wbraid",
+    "fbclid",
+    "msclkid",
+    "dclid",
+    "yclid",
+    "mc_cid",
+    "mc_eid",
+    "_ga",
+    "_gl",
+    "_ke",
+    "ref",
+    "referrer",
+    "srsltid",
+    "sessionid",
+    "sid",
+    "phpsessid",
+    "jsessionid",
+}
+
+TRACKING_PREFIXES = ("utm_", "pk_", "mtm_", "hsa_", "_hs")
+
+# Sorting, filtering and view options of catalog pages on the platforms in
+# TECHNOLOGIES, the page without them has the same contact details
+FACET_PARAMS = {
+    "sort",
+    "sort_by",
+    "sortby",
+    "order",
+    "orderby",
+    "dir",
+    "limit",
+    "per_page",
+    "view",
+    "mode",
+    "price",
+    "min_price",
+    "max_price",
+    "min",
+    "max",
+    "color",
+    "colour",
+    "kleur",
+    "size",
+    "maat",
+    "brand",
+    "merk",
+    "rating_filter",
+    "product_list_order",
+    "product_list_limit",
+    "product_list_mode",
+    "product_list_dir",
+    "q",
+    "s",
+    "search",
+    "query",
+}
+
+FACET_PREFIXES = ("filter", "query_type_", "pa_")
+
+# Query parameters and path segments that number the pages of a listing
+PAGINATION_PARAMS = {"page", "pg", "pagina", "paged"}
+PAGINATION_SEGMENTS = {"page", "pagina"}
+
+# Contact details are never further in a listing than this
+MAX_PAGE = 2
+
+# URLs beyond these limits are generated by the site and never end
+MAX_PATH_SEGMENTS = 8
+MAX_REPEATED_SEGMENTS = 2
+MAX_QUERY_PARAMS = 3
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+SESSION_PATH_PATTERN = re.compile(r";(jsessionid|phpsessid|sid)=[^/]*", re.IGNORECASE)
+ESCAPE_PATTERN = re.compile(r"%[0-9a-fA-F]{2}")
+
+
+def is_tracking_param(name):
+    name = name.lower()
+
+    return name in TRACKING_PARAMS or name.startswith(TRACKING_PREFIXES)
+
+
+def is_facet_param(name):
+    name = name.lower()
+
+    return name in FACET_PARAMS or name.startswith(FACET_PREFIXES)
+
+
+def page_number(value):
+    return int(value) if value.isdigit() else 0
+
+
+def canonical_path(path):
+    path = SESSION_PATH_PATTERN.sub("", path)
+    path = ESCAPE_PATTERN.sub(lambda match: match.group().upper(), path)
+    path = re.sub(r"/{2,}", "/", path)
+
+    # Resolve . and .. the way a browser does
+    segments = []
+
+    for segment in path.split("/")[1:]:
+        if segment == "..":
+            if segments:
+                segments.pop()
+        elif segment != ".":
+            segments.append(segment)
+
+    return "/" + "/".join(segments)
+
+
+def is_trap(path, params):
+    segments = [segment.lower() for segment in path.split("/") if segment]
+
+    if len(segments) > MAX_PATH_SEGMENTS:
+        return True
+
+    # Relative links that keep adding the same directory, e.g. /nl/nl/nl/
+    if any([segments.count(segment) > MAX_REPEATED_SEGMENTS for segment in segments]):
+        return True
+
+    for index, segment in enumerate(segments[:-1]):
+        if (
+            segment in PAGINATION_SEGMENTS
+            and page_number(segments[index + 1]) > MAX_PAGE
+        ):
+            return True
+
+    for name, value in params:
+        if name.lower() in PAGINATION_PARAMS and page_number(value) > MAX_PAGE:
+            return True
+
+    return len(params) > MAX_QUERY_PARAMS
+
+
+def canonical_url(url):
+    # The one form of a URL that every variant of the same page maps to, or
+    # None for URLs that are not worth fetching
+    try:
+        parsed = urlsplit(url.strip())
+        port = parsed.port
+    except ValueError:
+        return None
+
+    scheme = parsed.scheme.lower()
+    host = (parsed.hostname or "").rstrip(".")
+
+    if scheme not in DEFAULT_PORTS or not host:
+        return None
+
+    netloc = host if port in [None, DEFAULT_PORTS[scheme]] else f"{host}:{port}"
+    path = canonical_path(parsed.path)
+
+    params = [
+        (name, value)
+        for name, value in parse_qsl(parsed.query, keep_blank_values=True)
+        if not is_tracking_param(name) and not is_facet_param(name)
+    ]
+
+    if is_trap(path, params):
+        return None
+
+    # The first page of a listing is the listing itself
+    params = [
+        (name, value)
+        for name, value in params
+        if not (name.lower() in PAGINATION_PARAMS and page_number(value) <= 1)
+    ]
+
+    query = urlencode(sorted(params))
+
+    return urlunsplit((scheme, netloc, path, query, ""))
@@ -1,7 +1,11 @@
 import datetime
-import csv
-import requests
-import os
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from modules.generate_leads.platform_fingerprint import detect_platform
+from modules.utils import http_client, metrics
+from modules.utils.result_writer import get_writer
+from modules.utils.state_store import get_store
 
 # List of technologies to search for
 TECHNOLOGIES = [
@@ -14,104 +18,141 @@ TECHNOLOGIES = [
 
 
 def get_leads():
-    leads = []
-    filtered_leads = []
+    store = get_store()
 
-    # Get all leads
-    files = os.listdir("data")
+    # Read the rows added to the leads files since the last run
+    store.import_leads_files()
 
-    # Get all leads
-    for file in files:
-        if file.startswith("leads_"):
-            file_leads = csv.DictReader(open(f"data/{file}"))
+    # Stream the leads that have not been filtered yet
+    yield from store.unfiltered_leads()
 
-            for row in file_leads:
-                leads.append(row)
 
-    if os.path.exists("data/history/filtered_shops.txt"):
-        # Get all filtered shops
-        with open("data/history/filtered_shops.txt", "r") as f:
-            for line in f:
-                filtered_leads.append(line.strip())
-
-    # Remove filtered shops from leads
-    leads = [lead for lead in leads if not lead["website"] in filtered_leads]
-
-    return leads
-
-
-def filter_shops_platform():
-    # Create log file if it does not exist
-    if not os.path.exists("data/history/filtered_shops.txt"):
-        with open("data/history/filtered_shops.txt", "w") as f:
-            f.write("")
+def filter_shops_platform(workers=1, leads=None, on_shop=None):
+    # Leads can be any iterable, the pipeline runner streams them in and
+    # receives every shop on a matching platform through on_shop
+    store = get_store()
 
     # Create data file if it does not exist
     date_str = datetime.datetime.today().strftime("%Y-%m-%d")
     data_file_str = f"data/leads_{date_str}.csv"
 
-    # If file exists no need to write header
-    if not os.path.exists(data_file_str):
-        with open(data_file_str, "w") as f:
-            f.write("product,company,website,technology\n")
+    data_writer = get_writer(
+        data_file_str, ["product", "company", "website", "technology"]
+    )
+
+    # Guards the result list when running in parallel
+    result_lock = threading.Lock()
+
+    def check_shop(website, result):
+        try:
+            product = website["product"]
+            company = website["company"]
+            website_url = website["website"]
+
+            # Detect the platform from headers and the start of the page
+            with metrics.timer("detect_seconds", stage="filter"):
+                status_code, technology = detect_platform(
+                    website_url, TECHNOLOGIES, timeout=5
+                )
+
+            metrics.inc("shops_total", stage="filter", technology=technology or "none")
+
+            # Check if website is online
+            if status_code != 200:
+                return
+
+            # Check if website is of one of the technologies
+            if technology:
+                shop = {
+                    "product": product,
+                    "company": company,
+                    "website": website_url,
+                    "technology": technology,
+                    "products": website["products"],
+                }
+
+                with result_lock:
+                    result.append(shop)
+
+                    found_count = len(result)
+
+                # One row per product so the shop keeps all its products
+                for lead_product in website["products"]:
+                    data_writer.write_row(
+                        [lead_product, company, website_url, technology]
+                    )
 
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/132.0.0.0 Safari/537.36"
-    }
+                print(f"Found {technology} on {website_url} ({found_count})")
+
+                if on_shop:
+                    on_shop(shop)
+
+            # Record that this website has been checked
+            store.add_filtered_shop(website_url, technology)
+        except Exception as e:
+            metrics.count_exception("filter", e)
+            print(f"Error: {e}")
 
     def check_shops(websites):
         result = []
 
-        for website in websites:
-            try:
-                product = website["product"]
-                company = website["company"]
-                website_url = website["website"]
-
-                # Get HTML from website
-                response = requests.get(website_url, headers=headers, timeout=5)
-
-                # Check if website is online
-                if response.status_code != 200:
-                    continue
-
-                # Check if website is of one of the technologies
-                for technology in TECHNOLOGIES:
-                    if not technology.lower() in response.text.lower():
-                        continue
-
-                    result.append(
-                        {
-                            "product": product,
-                            "company": company,
-                            "website": website_url,
-                            "technology": technology,
-                        }
-                    )
+        if workers <= 1:
+            for website in websites:
+                check_shop(website, result)
+
+            return result
 
-                    with open(data_file_str, "a") as f:
-                        f.write(f"{product},{company},{website_url},{technology}\n")
+        websites = iter(websites)
+        websites_lock = threading.Lock()
 
-                    print(f"Found {technology} on {website_url} ({len(result)})")
-                    break
+        # Each worker takes the next lead when it is done with the previous
+        # one, so leads are only read from the iterable when they are checked
+        def worker():
+            while True:
+                with websites_lock:
+                    website = next(websites, None)
 
-                # Record that this website has been checked
-                with open("data/history/filtered_shops.txt", "a") as f:
-                    f.write(f"{website_url}\n")
-            except Exception as e:
-                print(f"Error: {e}")
-                continue
+                if website is None:
+                    return
+
+                check_shop(website, result)
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for future in [executor.submit(worker) for _ in range(workers)]:
+                future.result()
 
         return result
 
     # Load shops from daily leads list
-    leads = get_leads()
+    if leads is None:
+        leads = get_leads()
 
     print(f"Filtering initial leads by platform...")
 
     # Filter shops
-    check_shops(leads)
+    result = check_shops(leads)
+
+    http_client.log_connection_stats()
+
+    return result
 
 
 if __name__ == "__main__":
-    filter_shops_platform()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--cache", action="store_true")
+    parser.add_argument("--hedge", action="store_true")
+    metrics.add_arguments(parser)
+    args = parser.parse_args()
+
+    metrics.configure(args)
+
+    # Revalidate homepages fetched on earlier runs instead of downloading them
+    if args.cache:
+        http_client.enable_cache()
+
+    # Send slow homepage requests a second time and use the first response
+    if args.hedge:
+        http_client.enable_hedging()
+
+    filter_shops_platform(args.workers)
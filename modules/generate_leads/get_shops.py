@@ -1,13 +1,30 @@
 from urllib.parse import urlparse
-import random
-import time
+import argparse
+import threading
 import datetime
-import os
-from playwright.sync_api import sync_playwright
+from modules.utils import metrics
+from modules.utils.domains import registrable_domain
+from modules.utils.rate_limit import TokenBucket, THROTTLE_STATUSES
+from modules.utils.browser_pool import BrowserPool
+from modules.utils.result_writer import get_writer
+from modules.utils.state_store import get_store
 
 # Google search URL
 GOOGLE_SEARCH_URL = "https://www.bing.com/search"
 
+# Searches per second over all browsers, adapted to how Bing responds
+SEARCH_RATE = 0.3
+MIN_SEARCH_RATE = 0.05
+MAX_SEARCH_RATE = 1
+SEARCH_BURST = 2
+
+# Times a blocked result page is requested again before it is skipped
+MAX_BLOCKED_RETRIES = 3
+
+# Times a result page that failed to load is requested again before it is
+# skipped
+MAX_ERROR_RETRIES = 3
+
 FORBIDDEN_SHOPS = [
     "bol.com",
     "amazon.nl",
@@ -21,6 +38,15 @@ FORBIDDEN_SHOPS = [
 ]
 
 
+def is_blocked(page, response):
+    if response is not None and response.status in THROTTLE_STATUSES:
+        return True
+
+    return (
+        "captcha" in page.url.lower() or page.query_selector("#b_captcha") is not None
+    )
+
+
 def get_product_list():
     products = []
 
@@ -32,36 +58,43 @@ def get_product_list():
     # Remove duplicates
     products = list(set(products))
 
-    if os.path.exists("data/history/queried_products.txt"):
-        # Get already queried products
-        with open("data/history/queried_products.txt", "r") as f:
-            queried_products = [line.strip() for line in f]
+    # Remove queried products
+    store = get_store()
 
-        # Remove queried products
-        products = [product for product in products if product not in queried_products]
+    products = [
+        product for product in products if not store.is_product_queried(product)
+    ]
 
     return products
 
 
-def get_shops():
+def get_shops(workers=1, on_shop=None):
     date_str = datetime.datetime.today().strftime("%Y-%m-%d")
     data_file_str = f"data/shops_{date_str}.csv"
 
     # If file does not exist, create it
-    if not os.path.exists(data_file_str):
-        with open(data_file_str, "w") as data_file:
-            data_file.write("product,company,website\n")
+    data_writer = get_writer(data_file_str, ["product", "company", "website"])
+
+    # Domains found per product to prevent double entries, URL variants of the
+    # same shop are merged into one lead by the state store
+    found_domains = set()
+    found_lock = threading.Lock()
 
-    # History to prevent double entries
-    website_url_history = []
+    # Paces the searches of every browser instead of a fixed sleep
+    search_bucket = TokenBucket(
+        SEARCH_RATE, SEARCH_BURST, MIN_SEARCH_RATE, MAX_SEARCH_RATE
+    )
 
     # Function to perform Google search
     def google_search(page, product):
+        queried_product = product
         product = product.replace(" ", "+").lower()
 
         search_url = f"{GOOGLE_SEARCH_URL}?q={product}+kopen"
 
         page_count = 0
+        blocked_count = 0
+        error_count = 0
 
         result = []
 
@@ -70,8 +103,30 @@ def get_shops():
             try:
                 page_search_url = f"{search_url}&first={page_count * 10}"
 
-                page.goto(page_search_url)
-                page.wait_for_load_state("networkidle")
+                search_bucket.acquire()
+
+                with metrics.timer("search_seconds", stage="search"):
+                    response = page.goto(page_search_url)
+                    page.wait_for_load_state("networkidle")
+
+                # Slow down every browser and try the same page again
+                if is_blocked(page, response):
+                    search_bucket.throttled()
+                    blocked_count += 1
+
+                    print(f"Search blocked, slowing down to {search_bucket.rate:.2f}/s")
+
+                    if blocked_count <= MAX_BLOCKED_RETRIES:
+                        continue
+
+                    # Give up on this result page
+                    blocked_count = 0
+                    page_count += 1
+                    continue
+
+                search_bucket.success()
+                blocked_count = 0
+                error_count = 0
 
                 # Get all search results
                 websites = page.query_selector_all("a.tilk > div.tptxt")
@@ -101,12 +156,15 @@ def get_shops():
                     ) and not parsed_url.netloc.endswith(".com"):
                         continue
 
-                    # Check if URL was found already to prevent doubles
-                    if website_url_text in website_url_history:
-                        continue
+                    # Check if the shop was found already to prevent doubles
+                    key = (queried_product, registrable_domain(website_url_text))
+
+                    with found_lock:
+                        if key in found_domains:
+                            continue
 
-                    # Store website as result to prevent double entries
-                    website_url_history.append(website_url_text)
+                        # Store domain as result to prevent double entries
+                        found_domains.add(key)
 
                     # Append to result
                     result.append(
@@ -118,48 +176,71 @@ def get_shops():
                     )
 
                     # Write row for intermediary results
-                    with open(data_file_str, "a") as data_file:
-                        data_file.write(
-                            f"{product},{website_name_text},{website_url_text}\n"
+                    data_writer.write_row(
+                        [product, website_name_text, website_url_text]
+                    )
+
+                    # Hand the shop to the next stage of the pipeline
+                    if on_shop:
+                        on_shop(
+                            {
+                                "product": product,
+                                "company": website_name_text,
+                                "website": website_url_text,
+                            }
                         )
 
+                metrics.inc("shops_total", len(websites), stage="search")
+
                 # Increase page count (step in bing search)
                 page_count += 1
             except Exception as e:
+                # A crashed browser or closed page fails every retry, the
+                # browser pool restarts it and runs the product again
+                if page.is_closed() or not page.context.browser.is_connected():
+                    raise
+
+                metrics.count_exception("search", e)
                 print(f"Error: {e}")
+
+                error_count += 1
+
+                if error_count > MAX_ERROR_RETRIES:
+                    # Give up on this result page
+                    error_count = 0
+                    page_count += 1
+
                 continue
 
         # Write all found shops to history to prevent double searching
-        with open("data/history/queried_products.txt", "a") as f:
-            f.write(f"{product}\n")
+        get_store().add_queried_product(queried_product)
 
         return result
 
     # Get all products
     products = get_product_list()
 
-    # Start Playwright
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=True)
-        context = browser.new_context(
-            user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/132.0.0.0 Safari/537.36",
-            locale="nl-NL",
-        )
-        page = context.new_page()
+    def search_product(page, task):
+        index, product = task
 
-        # Iterate over all products
-        for index, product in enumerate(products):
-            # Print current product
-            print(f"Searching for {product}... ({index + 1} of {len(products)})")
+        # Print current product
+        print(f"Searching for {product}... ({index + 1} of {len(products)})")
 
-            # Perform Google search
-            google_search(page, product)
+        # Perform Google search
+        google_search(page, product)
 
-            # Random sleep to avoid being blocked
-            time.sleep(random.uniform(2, 5))
+    # Start Playwright
+    pool = BrowserPool(size=workers)
 
-        browser.close()
+    pool.map(search_product, enumerate(products))
 
 
 if __name__ == "__main__":
-    get_shops()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=1)
+    metrics.add_arguments(parser)
+    args = parser.parse_args()
+
+    metrics.configure(args)
+
+    get_shops(args.workers)
@@ -0,0 +1,189 @@
+import re
+from modules.utils import http_client, metrics
+
+# Stop scanning the body once this many bytes have been read
+MAX_SCAN_BYTES = 1024 * 1024
+
+CHUNK_SIZE = 16 * 1024
+
+# Response headers (lowercase) that identify a platform on their own
+HEADER_FINGERPRINTS = {
+    "Shopify": ["x-shopify-stage", "x-shopid", "x-shardid", "x-shopify-request-id"],
+    "Magento": ["x-magento-cache-debug", "x-magento-tags", "x-magento-cache-control"],
+    "Lightspeed": ["x-lightspeed-cache"],
+}
+
+# Cookie names (lowercase prefixes) that identify a platform on their own
+COOKIE_FINGERPRINTS = {
+    "Shopify": ["_shopify_y", "_shopify_s", "cart_sig", "secure_customer_sig"],
+    "WooCommerce": ["woocommerce_", "wp_woocommerce_session_"],
+    "Magento": ["mage-cache-", "x-magento-vary", "form_key"],
+}
+
+# Body markers that decide the platform as soon as they are seen
+STRONG_FINGERPRINTS = {
+    "Shopify": [
+        "cdn.shopify.com",
+        "myshopify.com",
+        "shopify.theme",
+        "shopify-section",
+        "shopifycloud",
+    ],
+    "WooCommerce": [
+        "wp-content/plugins/woocommerce",
+        "woocommerce-page",
+        "wc-ajax",
+        "woocommerce_params",
+    ],
+    "Magento": [
+        "x-magento-init",
+        "mage/cookies",
+        "magento_ui",
+        "requirejs-config.js",
+        "/static/version",
+    ],
+    "Lightspeed": [
+        "cdn.webshopapp.com",
+        "seoshop",
+        "lightspeedhq",
+    ],
+}
+
+# Body markers that only count when nothing stronger was found
+WEAK_FINGERPRINTS = {
+    "Shopify": ["shopify"],
+    "WooCommerce": ["woocommerce"],
+    "Magento": ["magento"],
+    "Lightspeed": ["lightspeed"],
+}
+
+
+class BodyScanner:
+    # One compiled alternation of every marker, run once over each chunk
+    def __init__(self, technologies):
+        self.technologies = technologies
+        self.markers = {}
+
+        for strength, fingerprints in [
+            ("weak", WEAK_FINGERPRINTS),
+            ("strong", STRONG_FINGERPRINTS),
+        ]:
+            for technology, markers in fingerprints.items():
+                if technology not in technologies:
+                    continue
+
+                for marker in markers:
+                    self.markers[marker.encode()] = (technology, strength)
+
+        # Longest markers first so a strong marker wins over its weak prefix
+        patterns = sorted(self.markers, key=len, reverse=True)
+
+        self.regex = re.compile(b"|".join(re.escape(marker) for marker in patterns))
+        self.overlap = max(len(marker) for marker in patterns) - 1
+        self.tail = b""
+        self.size = 0
+        self.weak_matches = set()
+
+    def feed(self, chunk):
+        self.size += len(chunk)
+
+        # Keep the end of the previous chunk for markers split over two chunks
+        data = self.tail + chunk.lower()
+        self.tail = data[-self.overlap :]
+
+        for match in self.regex.finditer(data):
+            technology, strength = self.markers[match.group(0)]
+
+            if strength == "strong":
+                return technology
+
+            self.weak_matches.add(technology)
+
+        return None
+
+    def finish(self):
+        # Same precedence as the technology list when only weak markers matched
+        for technology in self.technologies:
+            if technology in self.weak_matches:
+                return technology
+
+        return None
+
+
+def match_headers(response, technologies):
+    headers = [key.lower() for key in response.headers.keys()]
+    cookies = [name.lower() for name in response.cookies.keys()]
+
+    powered_by = response.headers.get("X-Powered-By", "").lower()
+
+    for technology in technologies:
+        if any(
+            [header in headers for header in HEADER_FINGERPRINTS.get(technology, [])]
+        ):
+            return technology
+
+        if any(
+            [
+                cookie.startswith(prefix)
+                for prefix in COOKIE_FINGERPRINTS.get(technology, [])
+                for cookie in cookies
+            ]
+        ):
+            return technology
+
+        if technology.lower() in powered_by:
+            return technology
+
+    return None
+
+
+def scan_body(chunks, technologies):
+    scanner = BodyScanner(technologies)
+
+    try:
+        for chunk in chunks:
+            technology = scanner.feed(chunk)
+
+            if technology:
+                return technology
+
+            if scanner.size >= MAX_SCAN_BYTES:
+                break
+
+        return scanner.finish()
+    finally:
+        metrics.inc("bytes_scanned_total", scanner.size, stage="filter")
+
+
+def detect_platform(url, technologies, timeout=5):
+    # Cached pages are revalidated and scanned from the stored body
+    if http_client.cache_enabled():
+        response = http_client.get_capped(url, MAX_SCAN_BYTES, timeout=timeout)
+
+        if response.status_code != 200:
+            return response.status_code, None
+
+        technology = match_headers(response, technologies) or scan_body(
+            [response.content], technologies
+        )
+
+        return response.status_code, technology
+
+    response = http_client.get(url, stream=True, timeout=timeout)
+
+    try:
+        if response.status_code != 200:
+            return response.status_code, None
+
+        # Headers and cookies are checked before any of the body is read
+        technology = match_headers(response, technologies)
+
+        if technology:
+            return response.status_code, technology
+
+        # Stop downloading as soon as a strong marker is found
+        return response.status_code, scan_body(
+            response.iter_content(CHUNK_SIZE), technologies
+        )
+    finally:
+        response.close()
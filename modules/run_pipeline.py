@@ -0,0 +1,194 @@
+import queue
+import argparse
+import threading
+from modules.enrich_leads.beautiful_soup_enrich_leads import scrape_website
+from modules.generate_leads.filter_shops_platform import (
+    filter_shops_platform,
+    get_leads,
+)
+from modules.utils import http_client, metrics
+from modules.utils.domains import registrable_domain
+from modules.utils.state_store import get_store
+
+# Items waiting between two stages, a full queue pauses the stage before it
+QUEUE_SIZE = 50
+
+# Put on a queue when the stage writing to it has finished
+DONE = object()
+
+
+def drain(items, name):
+    # Yield items until the stage before is done, the marker is put back so
+    # every consumer of the queue stops
+    while True:
+        metrics.set_gauge("queue_depth", items.qsize(), queue=name)
+
+        item = items.get()
+
+        if item is DONE:
+            items.put(DONE)
+            return
+
+        yield item
+
+
+def new_lead(store, domains, shop):
+    # Record the product even when the shop was found before
+    store.add_leads([shop])
+
+    domain = registrable_domain(shop["website"])
+
+    if domain in domains or store.is_shop_filtered(shop["website"]):
+        return None
+
+    domains.add(domain)
+
+    return {
+        **shop,
+        "technology": "",
+        "domain": domain,
+        "products": [shop["product"]],
+    }
+
+
+def filter_input(shops, pending):
+    # Shops found by the search go first, leads left over from earlier runs
+    # are checked whenever no new shop is waiting
+    store = get_store()
+    domains = set()
+    pending = iter(pending)
+
+    while True:
+        metrics.set_gauge("queue_depth", shops.qsize(), queue="shops")
+
+        try:
+            shop = shops.get_nowait()
+        except queue.Empty:
+            lead = next(pending, None)
+
+            if lead is not None:
+                if lead["domain"] not in domains:
+                    domains.add(lead["domain"])
+                    yield lead
+
+                continue
+
+            shop = shops.get()
+
+        if shop is DONE:
+            shops.put(DONE)
+            break
+
+        lead = new_lead(store, domains, shop)
+
+        if lead is not None:
+            yield lead
+
+    # The search has finished, check the rest of the backlog
+    for lead in pending:
+        if lead["domain"] not in domains:
+            domains.add(lead["domain"])
+            yield lead
+
+
+def run_pipeline(
+    search_workers=1, filter_workers=8, enrich_workers=4, search=True, backlog=True
+):
+    shops = queue.Queue(QUEUE_SIZE)
+    leads = queue.Queue(QUEUE_SIZE)
+
+    def search_stage():
+        try:
+            if search:
+                # Playwright is only needed when searching
+                from modules.generate_leads.get_shops import get_shops
+
+                get_shops(search_workers, on_shop=shops.put)
+        except Exception as e:
+            metrics.count_exception("pipeline", e)
+            print(f"Error in search stage: {e}")
+        finally:
+            shops.put(DONE)
+
+    def filter_stage():
+        try:
+            pending = get_leads() if backlog else []
+
+            filter_shops_platform(
+                filter_workers, filter_input(shops, pending), on_shop=leads.put
+            )
+        except Exception as e:
+            metrics.count_exception("pipeline", e)
+            print(f"Error in filter stage: {e}")
+        finally:
+            leads.put(DONE)
+
+            # Keep the search stage from blocking on a full queue
+            for _ in drain(shops, "shops"):
+                pass
+
+    def enrich_stage():
+        store = get_store()
+
+        for shop in drain(leads, "leads"):
+            if store.is_domain_enriched(shop["website"]):
+                continue
+
+            try:
+                scrape_website(shop["website"], shop["company"])
+            except Exception as e:
+                metrics.count_exception("pipeline", e)
+                print(f"[{shop['company']}] Error: {e}")
+                continue
+
+            print(f"[{shop['company']}] Done!")
+
+    threads = [
+        threading.Thread(target=search_stage, name="pipeline-search"),
+        threading.Thread(target=filter_stage, name="pipeline-filter"),
+    ]
+
+    threads += [
+        threading.Thread(target=enrich_stage, name=f"pipeline-enrich-{index}")
+        for index in range(enrich_workers)
+    ]
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    http_client.log_connection_stats()
+    print("Done!")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--search-workers", type=int, default=1)
+    parser.add_argument("--filter-workers", type=int, default=8)
+    parser.add_argument("--enrich-workers", type=int, default=4)
+    parser.add_argument("--no-search", dest="search", action="store_false")
+    parser.add_argument("--no-backlog", dest="backlog", action="store_false")
+    parser.add_argument("--cache", action="store_true")
+    parser.add_argument("--hedge", action="store_true")
+    metrics.add_arguments(parser)
+    args = parser.parse_args()
+
+    metrics.configure(args)
+
+    # Revalidate pages fetched on earlier runs instead of downloading them
+    if args.cache:
+        http_client.enable_cache()
+
+    # Send slow page requests a second time and use the first response
+    if args.hedge:
+        http_client.enable_hedging()
+
+    run_pipeline(
+        args.search_workers,
+        args.filter_workers,
+        args.enrich_workers,
+        args.search,
+        args.backlog,
+    )
@@ -0,0 +1,219 @@
+import os
+import queue
+import threading
+import psutil
+from playwright.sync_api import sync_playwright
+from modules.utils import metrics
+from modules.utils.http_client import USER_AGENT
+
+# Navigations after which a page and its context are replaced
+MAX_NAVIGATIONS = 200
+
+# Resident memory per browser of the pool after which contexts are replaced
+MAX_MEMORY_MB = 1024
+
+# Default timeout of every page action so a hung page cannot stall a worker
+PAGE_TIMEOUT = 30000
+
+# Times a task is retried after the browser crashed while running it
+MAX_RETRIES = 1
+
+# Consecutive failed browser launches after which a worker gives up
+MAX_RESTARTS = 3
+
+CONTEXT_OPTIONS = {
+    "user_agent": USER_AGENT,
+    "locale": "nl-NL",
+}
+
+
+def browser_memory_mb():
+    # Playwright drivers and browsers all run as children of this process
+    total = 0
+
+    for child in psutil.Process(os.getpid()).children(recursive=True):
+        try:
+            total += child.memory_info().rss
+        except psutil.Error:
+            continue
+
+    return total / (1024 * 1024)
+
+
+class PoolWorker:
+    # Sync Playwright objects belong to the thread that created them, so every
+    # worker thread owns its own browser with one context and page
+    def __init__(self, pool, worker_id):
+        self.pool = pool
+        self.worker_id = worker_id
+        self.browser = None
+        self.context = None
+        self.page = None
+        self.navigations = 0
+
+    def run(self):
+        failures = 0
+
+        while not self.pool.finished.is_set() and failures < MAX_RESTARTS:
+            try:
+                with sync_playwright() as p:
+                    self.browser = p.chromium.launch(headless=True)
+                    failures = 0
+
+                    self.serve()
+
+                    self.browser.close()
+                    return
+            except Exception as e:
+                failures += 1
+                metrics.inc("browser_restarts_total")
+                print(f"[browser {self.worker_id}] Restarting browser: {e}")
+            finally:
+                self.context = None
+                self.page = None
+
+        self.pool.worker_stopped()
+
+    def serve(self):
+        while True:
+            job = self.pool.jobs.get()
+
+            if job is None:
+                return
+
+            index, task, attempts = job
+
+            metrics.set_gauge("queue_depth", self.pool.jobs.qsize(), queue="browser")
+
+            try:
+                self.ensure_page()
+
+                self.pool.results[index] = self.pool.work(self.page, task)
+            except Exception as e:
+                crashed = not self.browser.is_connected()
+
+                metrics.count_exception("browser", e)
+
+                if not crashed:
+                    print(f"[browser {self.worker_id}] Error: {e}")
+                elif attempts < MAX_RETRIES:
+                    # Retry the task on a fresh browser
+                    self.pool.jobs.put((index, task, attempts + 1))
+
+                if crashed:
+                    raise
+            finally:
+                self.pool.jobs.task_done()
+
+            self.recycle_if_needed()
+
+    def ensure_page(self):
+        if self.page is not None and not self.page.is_closed():
+            return
+
+        self.context = self.browser.new_context(**self.pool.context_options)
+        self.page = self.context.new_page()
+        self.page.set_default_timeout(PAGE_TIMEOUT)
+        self.navigations = 0
+
+        def count_navigation(frame):
+            if frame == frame.page.main_frame:
+                self.navigations += 1
+
+        self.page.on("framenavigated", count_navigation)
+
+        if self.pool.setup_page:
+            self.pool.setup_page(self.page)
+
+    def recycle_if_needed(self):
+        # Every worker runs its own browser, so the total grows with the pool
+        if self.navigations < self.pool.max_navigations and (
+            browser_memory_mb() < self.pool.max_memory_mb * self.pool.size
+        ):
+            return
+
+        # Closing the context frees its renderer processes
+        try:
+            self.context.close()
+        except Exception:
+            pass
+
+        self.context = None
+        self.page = None
+
+
+class BrowserPool:
+    def __init__(
+        self,
+        size=4,
+        max_navigations=MAX_NAVIGATIONS,
+        max_memory_mb=MAX_MEMORY_MB,
+        context_options=CONTEXT_OPTIONS,
+        setup_page=None,
+    ):
+        self.size = size
+        self.max_navigations = max_navigations
+        self.max_memory_mb = max_memory_mb
+        self.context_options = context_options
+        self.setup_page = setup_page
+
+        self.jobs = queue.Queue()
+        self.results = {}
+        self.work = None
+        self.finished = threading.Event()
+        self.alive = 0
+        self.alive_lock = threading.Lock()
+
+    def worker_stopped(self):
+        with self.alive_lock:
+            self.alive -= 1
+
+            if self.alive > 0 or self.finished.is_set():
+                return
+
+        # No browser left to run the remaining tasks
+        print("Error: all browsers failed, dropping remaining tasks")
+
+        while True:
+            try:
+                self.jobs.get_nowait()
+            except queue.Empty:
+                return
+
+            self.jobs.task_done()
+
+    def map(self, work, tasks):
+        self.work = work
+        self.jobs = queue.Queue()
+        self.results = {}
+        self.finished.clear()
+
+        tasks = list(tasks)
+
+        for index, task in enumerate(tasks):
+            self.jobs.put((index, task, 0))
+
+        workers = [PoolWorker(self, worker_id) for worker_id in range(self.size)]
+        self.alive = len(workers)
+
+        threads = [
+            threading.Thread(target=worker.run, name=f"browser-{worker.worker_id}")
+            for worker in workers
+        ]
+
+        for thread in threads:
+            thread.start()
+
+        try:
+            # Wait for every task before telling the workers to stop
+            self.jobs.join()
+        finally:
+            self.finished.set()
+
+            for _ in threads:
+                self.jobs.put(None)
+
+            for thread in threads:
+                thread.join()
+
+        return [self.results.get(index) for index in range(len(tasks))]
@@ -0,0 +1,131 @@
+import ssl
+import time
+import socket
+import threading
+import requests
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError, SSLError
+from modules.utils import metrics
+from modules.utils.domains import hostname
+from modules.utils.state_store import get_store
+
+# Seconds a domain is skipped after its first failure, doubled with every
+# failure after that
+FAILURE_TTLS = {
+    "nxdomain": 24 * 3600,
+    "refused": 3600,
+    "timeout": 1800,
+    "tls": 6 * 3600,
+}
+
+MAX_TTL = 14 * 24 * 3600
+
+# Resolver errors that mean the name does not exist, not that DNS is down
+NXDOMAIN_ERRORS = {
+    socket.EAI_NONAME,
+    getattr(socket, "EAI_NODATA", socket.EAI_NONAME),
+}
+
+
+class DeadDomainError(requests.exceptions.ConnectionError):
+    pass
+
+
+def error_chain(error):
+    # requests wraps the socket error a few levels deep, follow the causes
+    pending = [error]
+    chain = []
+
+    while pending:
+        error = pending.pop()
+
+        if error is None or any([error is seen for seen in chain]):
+            continue
+
+        chain.append(error)
+
+        pending.extend(
+            [error.__cause__, error.__context__, getattr(error, "reason", None)]
+        )
+        pending.extend([arg for arg in error.args if isinstance(arg, BaseException)])
+
+    return chain
+
+
+def classify_failure(error):
+    chain = error_chain(error)
+
+    for error in chain:
+        if isinstance(error, socket.gaierror):
+            return "nxdomain" if error.errno in NXDOMAIN_ERRORS else None
+
+    if any([isinstance(error, ConnectionRefusedError) for error in chain]):
+        return "refused"
+
+    if any([isinstance(error, (ssl.SSLError, SSLError)) for error in chain]):
+        return "tls"
+
+    # urllib3 derives its other connection errors from ConnectTimeoutError
+    for error in chain:
+        if isinstance(error, requests.exceptions.ConnectTimeout):
+            return "timeout"
+
+        if isinstance(error, ConnectTimeoutError) and not isinstance(
+            error, NewConnectionError
+        ):
+            return "timeout"
+
+    return None
+
+
+class DeadDomainCache:
+    # Hosts that failed to connect, kept in memory for fast checks and in
+    # the state store so later runs and other processes skip them too. Keyed
+    # by the full host name, so a dead blog.shop.nl does not skip shop.nl
+    def __init__(self, store=None):
+        self.store = store or get_store()
+        self.lock = threading.Lock()
+        self.domains = self.store.dead_domains()
+
+    def check(self, url):
+        domain = hostname(url)
+        entry = self.domains.get(domain)
+
+        if entry is None or entry[2] <= time.time():
+            return
+
+        metrics.inc("dead_domain_skips_total", failure=entry[0])
+
+        raise DeadDomainError(
+            f"{domain} is skipped after {entry[1]} {entry[0]} failures"
+        )
+
+    def record_failure(self, url, error):
+        failure = classify_failure(error)
+
+        if failure is None:
+            return
+
+        domain = hostname(url)
+
+        with self.lock:
+            _, failures, _ = self.domains.get(domain, (None, 0, 0))
+
+            failures += 1
+            ttl = min(FAILURE_TTLS[failure] * 2 ** (failures - 1), MAX_TTL)
+
+            self.domains[domain] = (failure, failures, time.time() + ttl)
+
+        self.store.add_dead_domain(domain, failure, failures, time.time() + ttl)
+
+        metrics.inc("dead_domains_total", failure=failure)
+
+    def record_success(self, url):
+        domain = hostname(url)
+
+        if domain not in self.domains:
+            return
+
+        with self.lock:
+            self.domains.pop(domain, None)
+
+        self.store.remove_dead_domain(domain)
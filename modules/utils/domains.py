@@ -0,0 +1,94 @@
+import ipaddress
+from urllib.parse import urlparse
+
+# Public suffixes made of two labels, the registrable domain is the label in
+# front of them (shop.co.uk), for every other suffix it is the last two labels
+MULTI_PART_SUFFIXES = {
+    "co.uk",
+    "org.uk",
+    "me.uk",
+    "ac.uk",
+    "gov.uk",
+    "co.at",
+    "or.at",
+    "com.au",
+    "net.au",
+    "org.au",
+    "com.br",
+    "com.cn",
+    "com.es",
+    "com.gr",
+    "com.hk",
+    "co.il",
+    "co.in",
+    "co.jp",
+    "co.kr",
+    "com.mx",
+    "co.nz",
+    "com.pl",
+    "com.pt",
+    "com.sg",
+    "com.tr",
+    "com.tw",
+    "com.ua",
+    "co.za",
+}
+
+# Hosting platforms that give every shop its own subdomain, each of those
+# subdomains is a separate shop (shop-a.myshopify.com)
+PLATFORM_SUFFIXES = {
+    "myshopify.com",
+    "webshopapp.com",
+    "shoplightspeed.com",
+    "wixsite.com",
+    "squarespace.com",
+    "wordpress.com",
+    "blogspot.com",
+    "mybigcommerce.com",
+    "bigcartel.com",
+    "square.site",
+    "weebly.com",
+    "jouwweb.nl",
+    "mijnwebwinkel.nl",
+    "webnode.nl",
+    "github.io",
+    "netlify.app",
+    "vercel.app",
+    "herokuapp.com",
+}
+
+
+def hostname(url):
+    url = url.strip()
+
+    # Leads are often written without a scheme, e.g. www.shop.nl/winkel
+    if "://" not in url:
+        url = "//" + url
+
+    try:
+        host = urlparse(url).hostname or ""
+    except ValueError:
+        return ""
+
+    return host.rstrip(".")
+
+
+def registrable_domain(url):
+    host = hostname(url)
+
+    try:
+        ipaddress.ip_address(host)
+        return host
+    except ValueError:
+        pass
+
+    labels = host.split(".")
+
+    suffix = ".".join(labels[-2:])
+
+    if len(labels) > 2 and (
+        suffix in MULTI_PART_SUFFIXES or suffix in PLATFORM_SUFFIXES
+    ):
+        return ".".join(labels[-3:])
+
+    return ".".join(labels[-2:])
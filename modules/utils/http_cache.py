@@ -0,0 +1,282 @@
+import os
+import re
+import json
+import time
+import zlib
+import sqlite3
+import threading
+from email.utils import parsedate_to_datetime
+from requests import Response
+from requests.cookies import cookiejar_from_dict
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+CACHE_PATH = "data/cache/http_cache.db"
+
+# Total size of the stored (compressed) bodies
+MAX_CACHE_BYTES = 512 * 1024 * 1024
+
+# Entries older than this are removed regardless of their headers
+MAX_CACHE_AGE = 14 * 24 * 3600
+
+# Number of stores between eviction passes
+EVICT_INTERVAL = 500
+
+# Response headers kept with the cached body
+STORED_HEADERS = [
+    "Content-Type",
+    "ETag",
+    "Last-Modified",
+    "Cache-Control",
+    "Expires",
+    "Date",
+    # Platform fingerprints, cached pages are matched on them as well
+    "Set-Cookie",
+    "X-Powered-By",
+    "X-Shopify-Stage",
+    "X-ShopId",
+    "X-ShardId",
+    "X-Shopify-Request-Id",
+    "X-Magento-Cache-Debug",
+    "X-Magento-Tags",
+    "X-Magento-Cache-Control",
+    "X-Lightspeed-Cache",
+]
+
+# Name and value of every cookie in a combined Set-Cookie header, commas in
+# Expires dates are followed by a day and never by a name and =
+SET_COOKIE_PATTERN = re.compile(r"(?:^|,)\s*([^=;,\s]+)=([^;,]*)")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    url TEXT PRIMARY KEY,
+    status INTEGER,
+    headers TEXT,
+    body BLOB,
+    size INTEGER,
+    truncated INTEGER,
+    stored_at REAL,
+    accessed_at REAL
+);
+
+CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at);
+"""
+
+
+def freshness_lifetime(headers):
+    cache_control = headers.get("Cache-Control", "").lower()
+
+    if "no-cache" in cache_control or "no-store" in cache_control:
+        return 0
+
+    for directive in cache_control.split(","):
+        key, _, value = directive.strip().partition("=")
+
+        if key == "max-age" and value.isdigit():
+            return int(value)
+
+    expires = headers.get("Expires")
+    date = headers.get("Date")
+
+    if expires and date:
+        try:
+            return (
+                parsedate_to_datetime(expires) - parsedate_to_datetime(date)
+            ).total_seconds()
+        except Exception:
+            return 0
+
+    return 0
+
+
+class HttpCache:
+    def __init__(
+        self, path=CACHE_PATH, max_bytes=MAX_CACHE_BYTES, max_age=MAX_CACHE_AGE
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.local = threading.local()
+
+        self.stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.stores = 0
+
+        directory = os.path.dirname(path)
+
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with self.connection() as connection:
+            connection.executescript(SCHEMA)
+
+        self.evict()
+
+    def connection(self):
+        # SQLite connections cannot be shared between threads
+        connection = getattr(self.local, "connection", None)
+
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+
+            self.local.connection = connection
+
+        return connection
+
+    def count(self, counter):
+        with self.stats_lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def lookup(self, url):
+        row = (
+            self.connection()
+            .execute(
+                "SELECT status, headers, body, truncated, stored_at FROM responses WHERE url = ?",
+                (url,),
+            )
+            .fetchone()
+        )
+
+        if row is None:
+            return None
+
+        status, headers, body, truncated, stored_at = row
+
+        # Cut bodies stored by earlier runs would be revalidated and kept
+        if truncated:
+            return None
+
+        return {
+            "status": status,
+            "headers": json.loads(headers),
+            "body": body,
+            "truncated": bool(truncated),
+            "stored_at": stored_at,
+        }
+
+    def is_fresh(self, entry):
+        age = time.time() - entry["stored_at"]
+
+        return age < freshness_lifetime(entry["headers"])
+
+    def conditional_headers(self, entry):
+        headers = {}
+
+        if entry["headers"].get("ETag"):
+            headers["If-None-Match"] = entry["headers"]["ETag"]
+
+        if entry["headers"].get("Last-Modified"):
+            headers["If-Modified-Since"] = entry["headers"]["Last-Modified"]
+
+        return headers
+
+    def store(self, url, response, truncated=False):
+        # A body cut at a byte cap or deadline is not the page, and another
+        # caller may allow more of it
+        if response.status_code != 200 or truncated:
+            return
+
+        if "no-store" in response.headers.get("Cache-Control", "").lower():
+            return
+
+        headers = {
+            key: response.headers[key]
+            for key in STORED_HEADERS
+            if key in response.headers
+        }
+
+        body = zlib.compress(response.content, 6)
+        now = time.time()
+
+        with self.connection() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (url, 200, json.dumps(headers), body, len(body), truncated, now, now),
+            )
+
+        self.count("stores")
+
+        if self.stores % EVICT_INTERVAL == 0:
+            self.evict()
+
+    def refresh(self, url, entry, response):
+        # A 304 restarts the entry's age and may carry updated validators
+        headers = entry["headers"]
+
+        for key in STORED_HEADERS:
+            if key in response.headers and key != "Content-Type":
+                headers[key] = response.headers[key]
+
+        entry["stored_at"] = time.time()
+
+        with self.connection() as connection:
+            connection.execute(
+                "UPDATE responses SET headers = ?, stored_at = ?, accessed_at = ? WHERE url = ?",
+                (json.dumps(headers), entry["stored_at"], entry["stored_at"], url),
+            )
+
+    def mark_accessed(self, url):
+        with self.connection() as connection:
+            connection.execute(
+                "UPDATE responses SET accessed_at = ? WHERE url = ?",
+                (time.time(), url),
+            )
+
+    def to_response(self, url, entry):
+        response = Response()
+        response.url = url
+        response.status_code = entry["status"]
+        response.headers = CaseInsensitiveDict(entry["headers"])
+        response.cookies = cookiejar_from_dict(
+            dict(SET_COOKIE_PATTERN.findall(response.headers.get("Set-Cookie", "")))
+        )
+        response._content = zlib.decompress(entry["body"])
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.truncated = entry["truncated"]
+        response.from_cache = True
+
+        return response
+
+    def evict(self):
+        with self.connection() as connection:
+            # Remove entries older than the maximum age
+            connection.execute(
+                "DELETE FROM responses WHERE stored_at < ?",
+                (time.time() - self.max_age,),
+            )
+
+            total = connection.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()[0]
+
+            if total <= self.max_bytes:
+                return
+
+            # Remove least recently used entries until the cache fits
+            rows = connection.execute(
+                "SELECT url, size FROM responses ORDER BY accessed_at"
+            ).fetchall()
+
+            removed = []
+
+            for url, size in rows:
+                if total <= self.max_bytes:
+                    break
+
+                removed.append((url,))
+                total -= size
+
+            connection.executemany("DELETE FROM responses WHERE url = ?", removed)
+
+    def stats(self):
+        with self.stats_lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "revalidated": self.revalidated,
+                "stores": self.stores,
+            }
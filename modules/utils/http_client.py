@@ -0,0 +1,542 @@
+import time
+import socket
+import threading
+import requests
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import NameResolutionError
+from modules.utils import metrics
+from modules.utils.dead_domains import DeadDomainCache
+from modules.utils.latency import LatencyTracker, host_of
+from modules.utils.rate_limit import HostLimiter, THROTTLE_STATUSES
+from modules.utils.http_cache import (
+    HttpCache,
+    CACHE_PATH,
+    MAX_CACHE_BYTES,
+    MAX_CACHE_AGE,
+)
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/132.0.0.0 Safari/537.36"
+
+HEADERS = {
+    "User-Agent": USER_AGENT,
+}
+
+# Number of hosts to keep a connection pool for
+POOL_CONNECTIONS = 256
+
+# Number of idle keep-alive connections kept per host
+POOL_MAXSIZE = 16
+
+# Size of the chunks read from streamed responses
+CHUNK_SIZE = 64 * 1024
+
+# Times a throttled request is repeated after the wait its host asked for
+MAX_THROTTLE_RETRIES = 1
+
+# Threads that send hedged requests, only started after enable_hedging()
+HEDGE_WORKERS = 32
+
+# At most this share of requests is sent twice
+HEDGE_RATIO = 0.1
+
+
+# Seconds a resolved host is reused before it is looked up again
+DNS_TTL = 300
+
+# Seconds a host that does not exist is remembered
+NEGATIVE_DNS_TTL = 600
+
+MAX_DNS_ENTRIES = 100000
+
+_dns_cache = {}
+_dns_lock = threading.Lock()
+
+
+def resolve(host, port):
+    key = (host, port)
+    entry = _dns_cache.get(key)
+
+    # Cached lookups, including names that do not exist
+    if entry and entry[0] > time.monotonic():
+        metrics.inc("dns_cache_hits_total")
+
+        if isinstance(entry[1], socket.gaierror):
+            raise socket.gaierror(entry[1].errno, entry[1].strerror)
+
+        return entry[1]
+
+    try:
+        addresses = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+    except socket.gaierror as e:
+        # Temporary resolver failures are not cached
+        if e.errno == socket.EAI_NONAME:
+            store_dns(key, NEGATIVE_DNS_TTL, e)
+
+        raise
+
+    addresses = list(dict.fromkeys(address[4][0] for address in addresses))
+    store_dns(key, DNS_TTL, addresses)
+
+    return addresses
+
+
+def store_dns(key, ttl, value):
+    with _dns_lock:
+        if len(_dns_cache) >= MAX_DNS_ENTRIES:
+            _dns_cache.clear()
+
+        _dns_cache[key] = (time.monotonic() + ttl, value)
+
+
+class TimedConnectionMixin:
+    # Resolves the host separately so DNS and connect time are measured apart
+    def _new_conn(self):
+        host = self._dns_host
+        start = time.perf_counter()
+
+        try:
+            addresses = resolve(host, self.port)
+        except socket.gaierror as e:
+            raise NameResolutionError(self.host, self, e) from e
+        finally:
+            metrics.observe("dns_seconds", time.perf_counter() - start)
+
+        start = time.perf_counter()
+
+        try:
+            # Try every address like urllib3 does with the name itself
+            for index, address in enumerate(addresses):
+                self._dns_host = address
+
+                try:
+                    connection = super()._new_conn()
+                except Exception:
+                    if index == len(addresses) - 1:
+                        raise
+
+                    continue
+
+                _latency.observe(host, "connect", time.perf_counter() - start)
+
+                return connection
+        finally:
+            self._dns_host = host
+            metrics.observe("connect_seconds", time.perf_counter() - start)
+
+
+class TimedHTTPConnection(TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(TimedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+TIMED_POOL_CLASSES = {
+    "http": TimedHTTPConnectionPool,
+    "https": TimedHTTPSConnectionPool,
+}
+
+
+def record_response(response, *args, **kwargs):
+    # Time until the headers arrived, the body is timed by its reader
+    metrics.inc("responses_total", status=response.status_code)
+    metrics.observe("response_seconds", response.elapsed.total_seconds())
+
+    _latency.observe(host_of(response.url), "read", response.elapsed.total_seconds())
+
+
+def record_timeout(url, timeout, error):
+    # A request that timed out took at least as long as its timeout
+    if not isinstance(timeout, tuple):
+        return
+
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        _latency.observe(host_of(url), "connect", timeout[0])
+    elif isinstance(error, requests.exceptions.ReadTimeout):
+        _latency.observe(host_of(url), "read", timeout[1])
+
+
+class PooledAdapter(HTTPAdapter):
+    def __init__(self, *args, **kwargs):
+        self.stats_lock = threading.Lock()
+        self.closed_requests = 0
+        self.closed_connections = 0
+
+        super().__init__(*args, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+
+        self.poolmanager.pool_classes_by_scheme = TIMED_POOL_CLASSES
+        self.poolmanager.pools.dispose_func = self.dispose
+
+    def proxy_manager_for(self, *args, **kwargs):
+        manager = super().proxy_manager_for(*args, **kwargs)
+        manager.pool_classes_by_scheme = TIMED_POOL_CLASSES
+        manager.pools.dispose_func = self.dispose
+
+        return manager
+
+    def dispose(self, pool):
+        # Keep the counters of host pools that are evicted from a manager
+        with self.stats_lock:
+            self.closed_requests += pool.num_requests
+            self.closed_connections += pool.num_connections
+
+        pool.close()
+
+    def stats(self):
+        with self.stats_lock:
+            total_requests = self.closed_requests
+            total_connections = self.closed_connections
+
+        # Requests sent through a proxy use the pools of its own manager
+        managers = [self.poolmanager, *list(self.proxy_manager.values())]
+
+        for manager in managers:
+            pools = manager.pools
+
+            for key in pools.keys():
+                pool = pools.get(key)
+
+                if pool is None:
+                    continue
+
+                total_requests += pool.num_requests
+                total_connections += pool.num_connections
+
+        return total_requests, total_connections
+
+
+_session = None
+_session_lock = threading.Lock()
+
+# On-disk response cache, only used after enable_cache()
+_cache = None
+
+# Domains that recently failed to connect, created on first use
+_dead_domains = None
+
+# Concurrency and pauses of every host, shared by all threads
+_limiter = HostLimiter()
+
+# Latencies of every host, used for timeouts and hedging
+_latency = LatencyTracker()
+
+# Pool for hedged requests, only used after enable_hedging()
+_hedge_executor = None
+_hedge_lock = threading.Lock()
+_hedge_counts = {"requests": 0, "hedged": 0}
+
+
+def get_session():
+    global _session
+
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            session.headers.update(HEADERS)
+            session.hooks["response"].append(record_response)
+
+            adapter = PooledAdapter(
+                pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE
+            )
+
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+
+            _session = session
+
+    return _session
+
+
+def get_dead_domains():
+    global _dead_domains
+
+    with _session_lock:
+        if _dead_domains is None:
+            _dead_domains = DeadDomainCache()
+
+    return _dead_domains
+
+
+def connect_timeout(timeout):
+    return timeout[0] if isinstance(timeout, tuple) else timeout
+
+
+def is_shortened(timeout, requested):
+    if connect_timeout(timeout) is None:
+        return False
+
+    if connect_timeout(requested) is None:
+        return True
+
+    return connect_timeout(timeout) < connect_timeout(requested)
+
+
+def request(url, deadline=None, **kwargs):
+    # Known dead domains fail without touching the network
+    dead_domains = get_dead_domains()
+    dead_domains.check(url)
+
+    # A numeric timeout is the ceiling, the host's latencies decide the
+    # connect and read timeouts below it
+    timeout = requested = kwargs.get("timeout")
+
+    if isinstance(timeout, (int, float)):
+        kwargs["timeout"] = _latency.timeout(host_of(url), timeout)
+
+    # A deadline (a time.monotonic() value) caps the timeouts of the request
+    if deadline is not None:
+        remaining = deadline - time.monotonic()
+
+        if remaining <= 0:
+            raise requests.exceptions.Timeout(f"Deadline passed before {url}")
+
+        timeout = kwargs.get("timeout") or remaining
+
+        if isinstance(timeout, tuple):
+            kwargs["timeout"] = tuple([min(value, remaining) for value in timeout])
+        else:
+            kwargs["timeout"] = min(timeout, remaining)
+
+    shortened = is_shortened(kwargs.get("timeout"), requested)
+
+    for attempt in range(MAX_THROTTLE_RETRIES + 1):
+        host = _limiter.acquire(url)
+
+        try:
+            response = get_session().get(url, **kwargs)
+        except requests.RequestException as e:
+            _limiter.release(host, error=e)
+            record_timeout(url, kwargs.get("timeout"), e)
+
+            # A host that missed a timeout shorter than the caller's may
+            # just be slow, only the caller's own timeout marks it dead
+            if not (shortened and isinstance(e, requests.exceptions.Timeout)):
+                dead_domains.record_failure(url, e)
+
+            raise
+        except BaseException:
+            # Bad URLs and interrupts say nothing about the host, but the
+            # slot has to be given back or the host blocks forever
+            _limiter.release(host)
+            raise
+
+        _limiter.release(host, response)
+
+        # Only repeat requests the host asked to come back for
+        if (
+            response.status_code not in THROTTLE_STATUSES
+            or "Retry-After" not in response.headers
+            or attempt == MAX_THROTTLE_RETRIES
+        ):
+            break
+
+        response.close()
+
+    dead_domains.record_success(url)
+
+    return response
+
+
+def get(url, **kwargs):
+    return request(url, **kwargs)
+
+
+def get_capped(url, max_bytes, deadline=None, **kwargs):
+    if _cache is None:
+        return fetch_hedged(url, max_bytes, deadline, **kwargs)
+
+    entry = _cache.lookup(url)
+
+    # Fresh entries are served without touching the network
+    if entry and _cache.is_fresh(entry):
+        _cache.count("hits")
+        _cache.mark_accessed(url)
+
+        return _cache.to_response(url, entry)
+
+    # Stale entries are revalidated with their ETag and Last-Modified
+    headers = dict(kwargs.pop("headers", None) or {})
+
+    if entry:
+        headers.update(_cache.conditional_headers(entry))
+
+    response = fetch_hedged(url, max_bytes, deadline, headers=headers, **kwargs)
+
+    if entry and response.status_code == 304:
+        _cache.count("revalidated")
+        _cache.refresh(url, entry, response)
+
+        return _cache.to_response(url, entry)
+
+    _cache.count("misses")
+    _cache.store(url, response, response.truncated)
+
+    return response
+
+
+def fetch_capped(url, max_bytes, deadline=None, **kwargs):
+    # Stream the body and stop reading once max_bytes have been received or
+    # the deadline has passed, so a slowly dripping body cannot run over it
+    response = request(url, deadline, stream=True, **kwargs)
+
+    chunks = []
+    size = 0
+    truncated = False
+    start = time.perf_counter()
+
+    try:
+        for chunk in read_chunks(response, deadline):
+            chunks.append(chunk)
+            size += len(chunk)
+
+            if size >= max_bytes or (
+                deadline is not None and time.monotonic() >= deadline
+            ):
+                truncated = True
+                break
+    finally:
+        # Fully read responses go back to the pool, truncated ones are dropped
+        response.close()
+
+        metrics.observe("download_seconds", time.perf_counter() - start)
+        metrics.inc("bytes_fetched_total", size)
+
+    response._content = b"".join(chunks)[:max_bytes]
+    response.truncated = truncated
+
+    return response
+
+
+def read_chunks(response, deadline):
+    # iter_content waits until a whole chunk has arrived, with a deadline the
+    # body is read as it comes in so the deadline is checked between reads
+    if deadline is None:
+        yield from response.iter_content(CHUNK_SIZE)
+        return
+
+    while True:
+        chunk = response.raw.read1(CHUNK_SIZE, decode_content=True)
+
+        if not chunk:
+            return
+
+        yield chunk
+
+
+def fetch_hedged(url, max_bytes, deadline=None, **kwargs):
+    # A GET that is slower than most responses of its host is sent a second
+    # time, whichever copy succeeds first is used
+    delay = _latency.hedge_delay(host_of(url)) if _hedge_executor else None
+
+    if delay is None:
+        return fetch_capped(url, max_bytes, deadline, **kwargs)
+
+    with _hedge_lock:
+        _hedge_counts["requests"] += 1
+
+    first = _hedge_executor.submit(fetch_capped, url, max_bytes, deadline, **kwargs)
+    done, _ = wait([first], timeout=delay)
+
+    if done or not allow_hedge():
+        return first.result()
+
+    metrics.inc("hedged_requests_total")
+
+    pending = {
+        first,
+        _hedge_executor.submit(fetch_capped, url, max_bytes, deadline, **kwargs),
+    }
+
+    while True:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+        for future in done:
+            if future.exception() is None:
+                if future is not first:
+                    metrics.inc("hedge_wins_total")
+
+                return future.result()
+
+        # Both copies failed, report the error of the first one
+        if not pending:
+            return first.result()
+
+
+def allow_hedge():
+    # Keeps hedging from doubling the load on hosts that are slow for everyone
+    with _hedge_lock:
+        if _hedge_counts["hedged"] >= _hedge_counts["requests"] * HEDGE_RATIO:
+            return False
+
+        _hedge_counts["hedged"] += 1
+
+        return True
+
+
+def enable_hedging(workers=HEDGE_WORKERS):
+    global _hedge_executor
+
+    _hedge_executor = ThreadPoolExecutor(max_workers=workers)
+
+
+def cache_enabled():
+    return _cache is not None
+
+
+def enable_cache(path=CACHE_PATH, max_bytes=MAX_CACHE_BYTES, max_age=MAX_CACHE_AGE):
+    global _cache
+
+    _cache = HttpCache(path, max_bytes, max_age)
+
+
+def connection_stats():
+    session = get_session()
+
+    total_requests = 0
+    total_connections = 0
+
+    # Both schemes share the same adapter
+    for adapter in set(session.adapters.values()):
+        if not isinstance(adapter, PooledAdapter):
+            continue
+
+        adapter_requests, adapter_connections = adapter.stats()
+
+        total_requests += adapter_requests
+        total_connections += adapter_connections
+
+    return {
+        "requests": total_requests,
+        "connections": total_connections,
+        "reused": max(total_requests - total_connections, 0),
+    }
+
+
+def log_connection_stats():
+    stats = connection_stats()
+
+    print(
+        f"HTTP: {stats['requests']} requests over {stats['connections']} connections ({stats['reused']} reused)"
+    )
+
+    if _cache is not None:
+        stats = _cache.stats()
+
+        print(
+            f"Cache: {stats['hits']} hits | {stats['revalidated']} revalidated | {stats['misses']} misses"
+        )
@@ -0,0 +1,95 @@
+import threading
+from collections import deque
+from urllib.parse import urlparse
+
+# Latest latencies kept for every host and over all hosts together
+HOST_SAMPLES = 50
+GLOBAL_SAMPLES = 1000
+
+# Percentiles are only trusted after this many samples. Hosts without enough
+# of them fall back to the response times of all hosts, but keep the caller's
+# connect timeout, as a host that is slow to connect is not dead
+MIN_SAMPLES = 5
+
+# Timeouts are this many times the slow end of the latencies seen so far,
+# but never longer than the timeout the caller asked for
+TIMEOUT_PERCENTILE = 0.95
+TIMEOUT_FACTOR = 3
+MIN_TIMEOUTS = {"connect": 1, "read": 2}
+
+# A hedged request is sent once the first one is slower than most responses
+HEDGE_PERCENTILE = 0.9
+
+# Idle hosts are forgotten once this many are tracked
+MAX_HOSTS = 10000
+
+
+def host_of(url):
+    return urlparse(url).hostname or ""
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+class LatencyTracker:
+    # Connect and response latencies of every host, used to size timeouts and
+    # decide when a request is slow enough to hedge
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hosts = {}
+        self.totals = {
+            "connect": deque(maxlen=GLOBAL_SAMPLES),
+            "read": deque(maxlen=GLOBAL_SAMPLES),
+        }
+
+    def observe(self, host, kind, seconds):
+        with self.lock:
+            if host not in self.hosts:
+                if len(self.hosts) >= MAX_HOSTS:
+                    self.hosts.clear()
+
+                self.hosts[host] = {
+                    "connect": deque(maxlen=HOST_SAMPLES),
+                    "read": deque(maxlen=HOST_SAMPLES),
+                }
+
+            self.hosts[host][kind].append(seconds)
+            self.totals[kind].append(seconds)
+
+    def percentile(self, host, kind, fraction, fallback=True):
+        with self.lock:
+            samples = self.hosts.get(host, {}).get(kind, [])
+
+            if len(samples) < MIN_SAMPLES and fallback:
+                samples = self.totals[kind]
+
+            if len(samples) < MIN_SAMPLES:
+                return None
+
+            return percentile(list(samples), fraction)
+
+    def timeout(self, host, ceiling):
+        # Connect and read timeouts for the host, the ceiling until enough
+        # latencies have been seen
+        timeouts = []
+
+        for kind in ["connect", "read"]:
+            value = self.percentile(
+                host, kind, TIMEOUT_PERCENTILE, fallback=kind == "read"
+            )
+
+            if value is None:
+                timeouts.append(ceiling)
+                continue
+
+            timeouts.append(
+                min(max(value * TIMEOUT_FACTOR, MIN_TIMEOUTS[kind]), ceiling)
+            )
+
+        return tuple(timeouts)
+
+    def hedge_delay(self, host):
+        return self.percentile(host, "read", HEDGE_PERCENTILE)
@@ -0,0 +1,343 @@
+import os
+import sys
+import json
+import time
+import atexit
+import pstats
+import cProfile
+import datetime
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from modules.utils.result_writer import get_writer
+
+METRICS_DIRECTORY = "data/metrics"
+
+# Seconds between two snapshots in the JSON lines file
+REPORT_INTERVAL = 10
+
+# Seconds between two stack samples of the sampling profiler
+SAMPLE_INTERVAL = 0.005
+
+# Functions listed when a profile is printed at exit
+PROFILE_TOP = 25
+
+PROMETHEUS_PREFIX = "contactscraper_"
+
+# Helper threads that only sleep, left out of the samples
+IDLE_THREADS = {"metrics-reporter", "metrics-server", "result-writer"}
+
+
+class Metrics:
+    # Counters, gauges and timers keyed by name and labels, shared by every
+    # thread of the process
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.timers = {}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+
+        with self.lock:
+            self.gauges[key] = value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+
+        with self.lock:
+            count, total, maximum = self.timers.get(key, (0, 0, 0))
+            self.timers[key] = (count + 1, total + value, max(maximum, value))
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def snapshot(self):
+        with self.lock:
+            counters = dict(self.counters)
+            gauges = dict(self.gauges)
+            timers = dict(self.timers)
+
+        records = []
+
+        for (name, labels), value in counters.items():
+            records.append(
+                {
+                    "type": "counter",
+                    "name": name,
+                    "labels": dict(labels),
+                    "value": value,
+                }
+            )
+
+        for (name, labels), value in gauges.items():
+            records.append(
+                {"type": "gauge", "name": name, "labels": dict(labels), "value": value}
+            )
+
+        for (name, labels), (count, total, maximum) in timers.items():
+            records.append(
+                {
+                    "type": "summary",
+                    "name": name,
+                    "labels": dict(labels),
+                    "count": count,
+                    "sum": round(total, 6),
+                    "max": round(maximum, 6),
+                }
+            )
+
+        return records
+
+    def prometheus(self):
+        lines = []
+
+        for record in self.snapshot():
+            name = PROMETHEUS_PREFIX + record["name"]
+            labels = ",".join(
+                f'{key}="{str(value).replace(chr(34), chr(39))}"'
+                for key, value in record["labels"].items()
+            )
+            labels = "{" + labels + "}" if labels else ""
+
+            if record["type"] == "summary":
+                lines.append(f"{name}_count{labels} {record['count']}")
+                lines.append(f"{name}_sum{labels} {record['sum']}")
+                lines.append(f"{name}_max{labels} {record['max']}")
+            else:
+                lines.append(f"{name}{labels} {record['value']}")
+
+        return "\n".join(lines) + "\n"
+
+
+_metrics = Metrics()
+
+# JSON lines writer, only set after start_reporter()
+_writer = None
+
+
+def inc(name, value=1, **labels):
+    _metrics.inc(name, value, **labels)
+
+
+def set_gauge(name, value, **labels):
+    _metrics.set_gauge(name, value, **labels)
+
+
+def observe(name, value, **labels):
+    _metrics.observe(name, value, **labels)
+
+
+def timer(name, **labels):
+    return _metrics.timer(name, **labels)
+
+
+def snapshot():
+    return _metrics.snapshot()
+
+
+def count_exception(stage, error):
+    inc("exceptions_total", stage=stage, type=type(error).__name__)
+
+
+def event(stage, message, **fields):
+    # Progress lines stay readable on the console and are kept as records
+    print(message)
+
+    if _writer is not None:
+        _writer.write_line(
+            json.dumps(
+                {
+                    "time": time.time(),
+                    "type": "event",
+                    "stage": stage,
+                    "message": message,
+                    **fields,
+                }
+            )
+        )
+
+
+def write_snapshot():
+    now = time.time()
+
+    for record in _metrics.snapshot():
+        _writer.write_line(json.dumps({"time": now, **record}))
+
+
+def start_reporter(interval=REPORT_INTERVAL, directory=METRICS_DIRECTORY, suffix=""):
+    global _writer
+
+    os.makedirs(directory, exist_ok=True)
+
+    date_str = datetime.datetime.today().strftime("%Y-%m-%d")
+    _writer = get_writer(os.path.join(directory, f"metrics_{date_str}{suffix}.jsonl"))
+
+    def report():
+        while True:
+            time.sleep(interval)
+            write_snapshot()
+
+    threading.Thread(target=report, name="metrics-reporter", daemon=True).start()
+
+    # Final snapshot before the writers flush at exit
+    atexit.register(write_snapshot)
+
+
+class PrometheusHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+
+        body = _metrics.prometheus().encode("utf-8")
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve_prometheus(port, host="127.0.0.1"):
+    server = ThreadingHTTPServer((host, port), PrometheusHandler)
+    server.daemon_threads = True
+
+    threading.Thread(
+        target=server.serve_forever, name="metrics-server", daemon=True
+    ).start()
+
+    print(f"Serving metrics on http://{host}:{port}/metrics")
+
+    return server
+
+
+class SamplingProfiler:
+    # Samples the stacks of every thread, which cProfile cannot do for
+    # threads it was not enabled in
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()
+        self.running = True
+        self.thread = threading.Thread(
+            target=self.run, name="sampling-profiler", daemon=True
+        )
+        self.thread.start()
+
+    def run(self):
+        while self.running:
+            skipped = {
+                thread.ident
+                for thread in threading.enumerate()
+                if thread.name in IDLE_THREADS or thread is self.thread
+            }
+
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id in skipped:
+                    continue
+
+                stack = []
+
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(
+                        f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+                    )
+                    frame = frame.f_back
+
+                self.stacks[";".join(reversed(stack))] += 1
+
+            time.sleep(self.interval)
+
+    def stop(self, path):
+        self.running = False
+        self.thread.join()
+
+        # Folded stacks, the input format of flame graph tools
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+        total = sum(self.stacks.values()) or 1
+        leaves = Counter()
+
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+
+        print(f"Profile: {total} samples written to {path}")
+
+        for function, count in leaves.most_common(PROFILE_TOP):
+            print(f"{count / total * 100:6.1f}% {function}")
+
+
+def start_profiler(mode, directory=METRICS_DIRECTORY, suffix=""):
+    os.makedirs(directory, exist_ok=True)
+
+    date_str = datetime.datetime.today().strftime("%Y-%m-%d_%H%M%S")
+
+    if mode == "sample":
+        profiler = SamplingProfiler()
+        atexit.register(
+            profiler.stop, os.path.join(directory, f"profile_{date_str}{suffix}.folded")
+        )
+        return
+
+    # cProfile only sees the thread that enabled it
+    profiler = cProfile.Profile()
+    profiler.enable()
+
+    def stop():
+        profiler.disable()
+
+        path = os.path.join(directory, f"profile_{date_str}{suffix}.prof")
+        profiler.dump_stats(path)
+
+        print(f"Profile: written to {path}")
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(PROFILE_TOP)
+
+    atexit.register(stop)
+
+
+def add_arguments(parser):
+    parser.add_argument(
+        "--metrics",
+        action="store_true",
+        help="write metrics to data/metrics as JSON lines",
+    )
+    parser.add_argument("--metrics-interval", type=float, default=REPORT_INTERVAL)
+    parser.add_argument(
+        "--metrics-port", type=int, help="serve Prometheus text metrics on this port"
+    )
+    parser.add_argument("--profile", choices=["cprofile", "sample"])
+
+
+def configure(args, worker=None):
+    # Worker processes write their own files and serve on the ports after
+    # the one of the process that started them
+    suffix = "" if worker is None else f"_worker{worker}"
+
+    if args.metrics:
+        start_reporter(args.metrics_interval, suffix=suffix)
+
+    if args.metrics_port:
+        serve_prometheus(args.metrics_port + (0 if worker is None else worker + 1))
+
+    if args.profile:
+        start_profiler(args.profile, suffix=suffix)
@@ -0,0 +1,175 @@
+import time
+import threading
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+from modules.utils import metrics
+
+# Concurrent requests per host, raised by one for every window of good
+# responses and halved on throttling
+INITIAL_HOST_LIMIT = 2
+MIN_HOST_LIMIT = 1
+MAX_HOST_LIMIT = 8
+DECREASE_FACTOR = 0.5
+
+# Statuses that ask the client to slow down
+THROTTLE_STATUSES = {429, 503}
+
+# Seconds a host is paused after throttling without a Retry-After header
+BACKOFF_SECONDS = 2
+MAX_BACKOFF_SECONDS = 60
+
+# Responses slower than this many times the fastest one count as overload
+SLOW_FACTOR = 4
+MIN_SLOW_SECONDS = 1
+
+# Idle hosts are forgotten once this many are tracked
+MAX_HOSTS = 10000
+
+
+def retry_after_seconds(response):
+    value = response.headers.get("Retry-After")
+
+    if not value:
+        return None
+
+    if value.strip().isdigit():
+        return min(int(value), MAX_BACKOFF_SECONDS)
+
+    try:
+        return min(
+            max(parsedate_to_datetime(value).timestamp() - time.time(), 0),
+            MAX_BACKOFF_SECONDS,
+        )
+    except (TypeError, ValueError):
+        return None
+
+
+class HostState:
+    def __init__(self):
+        self.limit = INITIAL_HOST_LIMIT
+        self.in_flight = 0
+        self.not_before = 0
+        self.backoff = BACKOFF_SECONDS
+        self.fastest = None
+        self.last_used = time.monotonic()
+
+
+class HostLimiter:
+    # Additive increase, multiplicative decrease of the concurrency of every
+    # host, driven by its status codes, Retry-After headers and latency
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.hosts = {}
+
+    def acquire(self, url):
+        host = urlparse(url).netloc
+
+        with self.condition:
+            while True:
+                state = self.hosts.get(host)
+
+                if state is None:
+                    self.prune()
+                    state = self.hosts[host] = HostState()
+
+                wait = state.not_before - time.monotonic()
+
+                if wait <= 0 and state.in_flight < int(state.limit):
+                    break
+
+                self.condition.wait(wait if wait > 0 else None)
+
+            state.in_flight += 1
+            state.last_used = time.monotonic()
+
+        return host
+
+    def release(self, host, response=None, error=None):
+        with self.condition:
+            state = self.hosts[host]
+            state.in_flight -= 1
+
+            if response is not None and response.status_code in THROTTLE_STATUSES:
+                self.decrease(state, retry_after_seconds(response))
+            elif error is not None:
+                self.decrease(state, None)
+            elif response is not None and self.is_slow(state, response):
+                state.limit = max(state.limit * DECREASE_FACTOR, MIN_HOST_LIMIT)
+            elif response is not None:
+                state.limit = min(state.limit + 1 / state.limit, MAX_HOST_LIMIT)
+                state.backoff = BACKOFF_SECONDS
+
+            self.condition.notify_all()
+
+    def decrease(self, state, pause):
+        state.limit = max(state.limit * DECREASE_FACTOR, MIN_HOST_LIMIT)
+
+        # Without a Retry-After header the pause doubles every time
+        if pause is None:
+            pause = state.backoff
+            state.backoff = min(state.backoff * 2, MAX_BACKOFF_SECONDS)
+
+        state.not_before = max(state.not_before, time.monotonic() + pause)
+
+        metrics.inc("throttled_total", stage="http")
+
+    def is_slow(self, state, response):
+        elapsed = response.elapsed.total_seconds()
+
+        if state.fastest is None or elapsed < state.fastest:
+            state.fastest = elapsed
+
+        return elapsed > max(state.fastest * SLOW_FACTOR, MIN_SLOW_SECONDS)
+
+    def prune(self):
+        if len(self.hosts) < MAX_HOSTS:
+            return
+
+        idle = [host for host, state in self.hosts.items() if state.in_flight == 0]
+        idle.sort(key=lambda host: self.hosts[host].last_used)
+
+        for host in idle[: len(idle) // 2]:
+            del self.hosts[host]
+
+
+class TokenBucket:
+    # Requests at an average rate with short bursts, the rate grows while
+    # responses are fine and is cut when the server pushes back
+    def __init__(self, rate, capacity=1, min_rate=None, max_rate=None, step=None):
+        self.rate = rate
+        self.capacity = capacity
+        self.min_rate = min_rate or rate / 8
+        self.max_rate = max_rate or rate * 4
+        self.step = step or rate / 10
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.tokens + (now - self.updated) * self.rate, self.capacity)
+        self.updated = now
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                self.refill()
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                wait = (1 - self.tokens) / self.rate
+
+            time.sleep(wait)
+
+    def success(self):
+        with self.lock:
+            self.rate = min(self.rate + self.step, self.max_rate)
+
+    def throttled(self):
+        with self.lock:
+            self.rate = max(self.rate * DECREASE_FACTOR, self.min_rate)
+            self.tokens = min(self.tokens, 0)
+
+        metrics.inc("throttled_total", stage="search")
@@ -0,0 +1,112 @@
+import io
+import csv
+import time
+import atexit
+import signal
+import threading
+
+# Rows kept in memory before they are written to disk
+BATCH_SIZE = 100
+
+# Seconds between flushes of partially filled buffers
+FLUSH_INTERVAL = 5.0
+
+_writers = {}
+_writers_lock = threading.Lock()
+_flusher = None
+
+
+class ResultWriter:
+    def __init__(self, path, header=None, batch_size=BATCH_SIZE):
+        self.path = path
+        self.batch_size = batch_size
+        self.buffer = []
+        self.lock = threading.Lock()
+
+        # If file exists no need to write header, exclusive creation keeps
+        # concurrent processes from truncating each other's rows
+        try:
+            with open(path, "x", newline="") as f:
+                if header:
+                    csv.writer(f, lineterminator="\n").writerow(header)
+        except FileExistsError:
+            pass
+
+    def write_row(self, row):
+        # Quote fields so commas and quotes in values keep the CSV intact
+        line = io.StringIO()
+        csv.writer(line, lineterminator="\n").writerow(row)
+
+        self.append(line.getvalue())
+
+    def write_line(self, line):
+        self.append(f"{line}\n")
+
+    def append(self, text):
+        with self.lock:
+            self.buffer.append(text)
+
+            if len(self.buffer) >= self.batch_size:
+                self.flush_locked()
+
+    def flush(self):
+        with self.lock:
+            self.flush_locked()
+
+    def flush_locked(self):
+        if not self.buffer:
+            return
+
+        with open(self.path, "a", newline="") as f:
+            f.write("".join(self.buffer))
+
+        self.buffer = []
+
+
+def get_writer(path, header=None, batch_size=BATCH_SIZE):
+    # One writer per file so every stage and thread shares the same buffer
+    with _writers_lock:
+        if path not in _writers:
+            _writers[path] = ResultWriter(path, header, batch_size)
+
+        start_flusher()
+
+        return _writers[path]
+
+
+def flush_all():
+    with _writers_lock:
+        writers = list(_writers.values())
+
+    for writer in writers:
+        try:
+            writer.flush()
+        except Exception as e:
+            print(f"Error flushing {writer.path}: {e}")
+
+
+def start_flusher():
+    global _flusher
+
+    if _flusher is not None:
+        return
+
+    def run():
+        while True:
+            time.sleep(FLUSH_INTERVAL)
+            flush_all()
+
+    _flusher = threading.Thread(target=run, name="result-writer", daemon=True)
+    _flusher.start()
+
+    # Flush on normal exit, Ctrl-C and SIGTERM
+    atexit.register(flush_all)
+
+    if threading.current_thread() is threading.main_thread():
+        if signal.getsignal(signal.SIGTERM) == signal.SIG_DFL:
+            signal.signal(signal.SIGTERM, handle_sigterm)
+
+
+def handle_sigterm(signum, frame):
+    # Raising SystemExit unwinds the stack so atexit handlers run
+    raise SystemExit(128 + signum)
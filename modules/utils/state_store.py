@@ -0,0 +1,637 @@
+import os
+import csv
+import json
+import time
+import sqlite3
+import threading
+from modules.utils.domains import PLATFORM_SUFFIXES, registrable_domain
+
+DATABASE_PATH = "data/state.db"
+
+HISTORY_DIRECTORY = "data/history"
+
+# One row per enriched shop, rows imported from the old history only have the
+# company name
+ENRICHED_LEADS_TABLE = """
+CREATE TABLE IF NOT EXISTS enriched_leads (
+    company TEXT,
+    enriched_at REAL,
+    domain TEXT UNIQUE
+);
+"""
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+
+CREATE TABLE IF NOT EXISTS queried_products (
+    product TEXT PRIMARY KEY,
+    queried_at REAL
+);
+
+CREATE TABLE IF NOT EXISTS filtered_shops (
+    website TEXT PRIMARY KEY,
+    technology TEXT,
+    checked_at REAL,
+    domain TEXT
+);
+
+{ENRICHED_LEADS_TABLE}
+
+CREATE INDEX IF NOT EXISTS enriched_leads_company ON enriched_leads (company);
+
+CREATE TABLE IF NOT EXISTS leads (
+    id INTEGER PRIMARY KEY,
+    product TEXT,
+    company TEXT,
+    website TEXT,
+    technology TEXT,
+    domain TEXT,
+    UNIQUE (product, company, website)
+);
+
+CREATE INDEX IF NOT EXISTS leads_website ON leads (website);
+CREATE INDEX IF NOT EXISTS leads_company ON leads (company);
+
+CREATE TABLE IF NOT EXISTS imported_files (
+    name TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime REAL,
+    position INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS pages (
+    url TEXT PRIMARY KEY,
+    company TEXT,
+    status INTEGER,
+    fetched_at REAL
+);
+
+CREATE TABLE IF NOT EXISTS contacts (
+    company TEXT,
+    kind TEXT,
+    value TEXT,
+    site TEXT,
+    page TEXT,
+    found_at REAL,
+    PRIMARY KEY (company, kind, value)
+);
+
+CREATE TABLE IF NOT EXISTS dead_domains (
+    domain TEXT PRIMARY KEY,
+    failure TEXT,
+    failures INTEGER,
+    retry_at REAL,
+    updated_at REAL
+);
+
+CREATE TABLE IF NOT EXISTS work_queue (
+    queue TEXT,
+    item TEXT,
+    payload TEXT,
+    status TEXT,
+    owner TEXT,
+    lease_until REAL,
+    attempts INTEGER DEFAULT 0,
+    updated_at REAL,
+    PRIMARY KEY (queue, item)
+);
+
+CREATE INDEX IF NOT EXISTS work_queue_status ON work_queue (queue, status, lease_until);
+"""
+
+# Tables that are looked up by the registrable domain of their website column
+DOMAIN_TABLES = {
+    "leads": "website",
+    "filtered_shops": "website",
+    "enriched_leads": None,
+}
+
+# Leads merged into one row per registrable domain, the first lead found
+# represents the domain and keeps the products of all of them. Read in pages
+# by id so leads are streamed and every lookup goes through an index
+DOMAIN_LEADS_QUERY = """
+SELECT
+    leads.id,
+    leads.product,
+    leads.company,
+    leads.website,
+    (SELECT MAX(technology) FROM leads AS other WHERE other.domain = leads.domain),
+    leads.domain,
+    (SELECT json_group_array(DISTINCT product) FROM leads AS other WHERE other.domain = leads.domain)
+FROM leads
+WHERE leads.id > ?
+AND leads.id = (SELECT MIN(id) FROM leads AS other WHERE other.domain = leads.domain)
+AND {condition}
+ORDER BY leads.id
+LIMIT ?
+"""
+
+# Leads read from the database or a leads file at a time
+LEADS_BATCH_SIZE = 1000
+
+# History text files and the table and columns they are imported into
+HISTORY_FILES = {
+    "queried_products.txt": ("queried_products", "product", "queried_at"),
+    "filtered_shops.txt": ("filtered_shops", "website", "checked_at"),
+    "enriched_leads.txt": ("enriched_leads", "company", "enriched_at"),
+}
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+class StateStore:
+    def __init__(self, path=DATABASE_PATH):
+        self.path = path
+        self.local = threading.local()
+
+        directory = os.path.dirname(path)
+
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with self.connection() as connection:
+            connection.executescript(SCHEMA)
+
+        self.migrate_enriched_leads()
+        self.migrate_domains()
+        self.migrate_imported_files()
+        self.migrate_history()
+
+    def connection(self):
+        # SQLite connections cannot be shared between threads
+        connection = getattr(self.local, "connection", None)
+
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+
+            self.local.connection = connection
+
+        return connection
+
+    def execute(self, query, params=()):
+        with self.connection() as connection:
+            return connection.execute(query, params)
+
+    def exists(self, query, params=()):
+        return self.execute(query, params).fetchone() is not None
+
+    def migrate_enriched_leads(self):
+        # Databases where enriched leads were keyed by company name, which hid
+        # shops that share a name and left later shops without a domain
+        table = self.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'enriched_leads'"
+        ).fetchone()[0]
+
+        if "company TEXT PRIMARY KEY" not in table:
+            return
+
+        with self.connection() as connection:
+            columns = [
+                row[1]
+                for row in connection.execute("PRAGMA table_info(enriched_leads)")
+            ]
+            domain = "domain" if "domain" in columns else "NULL"
+
+            connection.execute(
+                "ALTER TABLE enriched_leads RENAME TO enriched_leads_old"
+            )
+            connection.execute(ENRICHED_LEADS_TABLE)
+            connection.execute(f"""
+                INSERT OR IGNORE INTO enriched_leads (company, enriched_at, domain)
+                SELECT company, enriched_at, {domain} FROM enriched_leads_old
+                """)
+
+            # The old indexes are dropped with the old table
+            connection.execute("DROP TABLE enriched_leads_old")
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS enriched_leads_company ON enriched_leads (company)"
+            )
+
+    def migrate_domains(self):
+        # Databases created before leads were merged by domain
+        with self.connection() as connection:
+            for table, column in DOMAIN_TABLES.items():
+                columns = [
+                    row[1] for row in connection.execute(f"PRAGMA table_info({table})")
+                ]
+
+                if "domain" not in columns:
+                    connection.execute(f"ALTER TABLE {table} ADD COLUMN domain TEXT")
+
+                # Shops on a hosting platform were once merged under the
+                # platform's own domain
+                platforms = ", ".join(["?"] * len(PLATFORM_SUFFIXES))
+
+                if column:
+                    rows = connection.execute(
+                        f"SELECT rowid, {column} FROM {table} WHERE domain IS NULL OR domain IN ({platforms})",
+                        sorted(PLATFORM_SUFFIXES),
+                    ).fetchall()
+
+                    connection.executemany(
+                        f"UPDATE {table} SET domain = ? WHERE rowid = ?",
+                        [
+                            (registrable_domain(value or ""), rowid)
+                            for rowid, value in rows
+                        ],
+                    )
+                else:
+                    connection.execute(
+                        f"UPDATE {table} SET domain = NULL WHERE domain IN ({platforms})",
+                        sorted(PLATFORM_SUFFIXES),
+                    )
+
+                connection.execute(
+                    f"CREATE INDEX IF NOT EXISTS {table}_domain ON {table} (domain)"
+                )
+
+    def migrate_imported_files(self):
+        # Databases created before leads files were read from where they ended
+        columns = [row[1] for row in self.execute("PRAGMA table_info(imported_files)")]
+
+        if "position" not in columns:
+            self.execute("ALTER TABLE imported_files ADD COLUMN position INTEGER")
+
+    def migrate_history(self, directory=HISTORY_DIRECTORY):
+        # Import the old text history files once
+        if self.exists("SELECT 1 FROM meta WHERE key = 'history_migrated'"):
+            return
+
+        now = time.time()
+
+        with self.connection() as connection:
+            for file, (table, column, time_column) in HISTORY_FILES.items():
+                path = os.path.join(directory, file)
+
+                if not os.path.exists(path):
+                    continue
+
+                with open(path, "r") as f:
+                    rows = [(line.strip(), now) for line in f if line.strip()]
+
+                connection.executemany(
+                    f"INSERT OR IGNORE INTO {table} ({column}, {time_column}) VALUES (?, ?)",
+                    rows,
+                )
+
+                # Shops in the history are matched by their domain
+                if table in DOMAIN_TABLES and DOMAIN_TABLES[table]:
+                    connection.executemany(
+                        f"UPDATE {table} SET domain = ? WHERE {column} = ?",
+                        [(registrable_domain(value), value) for value, _ in rows],
+                    )
+
+                print(f"Imported {len(rows)} rows from {path}")
+
+            connection.execute(
+                "INSERT INTO meta (key, value) VALUES ('history_migrated', ?)",
+                (str(now),),
+            )
+
+    # Products
+
+    def is_product_queried(self, product):
+        return self.exists(
+            "SELECT 1 FROM queried_products WHERE product = ?", (product,)
+        )
+
+    def add_queried_product(self, product):
+        self.execute(
+            "INSERT OR IGNORE INTO queried_products (product, queried_at) VALUES (?, ?)",
+            (product, time.time()),
+        )
+
+    # Shops
+
+    def is_shop_filtered(self, website):
+        return self.exists(
+            "SELECT 1 FROM filtered_shops WHERE domain = ?",
+            (registrable_domain(website),),
+        )
+
+    def add_filtered_shop(self, website, technology=None):
+        self.execute(
+            "INSERT OR REPLACE INTO filtered_shops (website, technology, checked_at, domain) VALUES (?, ?, ?, ?)",
+            (website, technology, time.time(), registrable_domain(website)),
+        )
+
+    # Leads
+
+    def add_leads(self, rows):
+        with self.connection() as connection:
+            connection.executemany(
+                """
+                INSERT INTO leads (product, company, website, technology, domain)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (product, company, website) DO UPDATE
+                SET technology = COALESCE(excluded.technology, technology)
+                """,
+                [
+                    (
+                        row.get("product"),
+                        row.get("company"),
+                        row.get("website"),
+                        row.get("technology") or None,
+                        registrable_domain(row.get("website") or ""),
+                    )
+                    for row in rows
+                ],
+            )
+
+    def import_leads_files(self, directory="data"):
+        # Files only grow during a day, so each one is read from where the
+        # last import stopped
+        for file in sorted(os.listdir(directory)):
+            if not file.startswith("leads_"):
+                continue
+
+            path = os.path.join(directory, file)
+            stat = os.stat(path)
+
+            row = self.execute(
+                "SELECT size, mtime, position FROM imported_files WHERE name = ?",
+                (file,),
+            ).fetchone()
+
+            if row and row[0] == stat.st_size and row[1] == stat.st_mtime:
+                continue
+
+            position = row[2] or 0 if row else 0
+
+            # A file that shrank was written again, read it from the start
+            if position > stat.st_size:
+                position = 0
+
+            position, count = self.import_leads_file(path, position)
+
+            self.execute(
+                "INSERT OR REPLACE INTO imported_files (name, size, mtime, position) VALUES (?, ?, ?, ?)",
+                (file, stat.st_size, stat.st_mtime, position),
+            )
+
+            if count:
+                print(f"Imported {count} leads from {path}")
+
+    def import_leads_file(self, path, position=0):
+        # Returns the byte position after the last complete row and the number
+        # of rows read, a row still being written is left for the next import
+        with open(path, "rb") as f:
+            header = next(csv.reader([f.readline().decode("utf-8-sig")]), None)
+
+            if not header:
+                return 0, 0
+
+            position = max(position, f.tell())
+            end = position
+            f.seek(position)
+
+            def lines():
+                nonlocal end
+
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        return
+
+                    end += len(line)
+
+                    yield line.decode("utf-8")
+
+            rows = []
+            count = 0
+
+            try:
+                # The reader only takes the lines of the row it returns, so
+                # end is the position after that row
+                for values in csv.reader(lines()):
+                    position = end
+
+                    if not values:
+                        continue
+
+                    rows.append(dict(zip(header, values)))
+                    count += 1
+
+                    if len(rows) >= LEADS_BATCH_SIZE:
+                        self.add_leads(rows)
+                        rows = []
+            except csv.Error:
+                pass
+
+            self.add_leads(rows)
+
+        return position, count
+
+    def domain_leads(self, condition):
+        # Pages are queried one after the other, so rows stay consistent with
+        # shops recorded while the leads are being checked
+        last_id = 0
+
+        while True:
+            rows = self.execute(
+                DOMAIN_LEADS_QUERY.format(condition=condition),
+                (last_id, LEADS_BATCH_SIZE),
+            ).fetchall()
+
+            for row in rows:
+                yield lead_row(row[1:])
+
+            if len(rows) < LEADS_BATCH_SIZE:
+                return
+
+            last_id = rows[-1][0]
+
+    def unfiltered_leads(self):
+        # One lead per domain, so every shop is checked once
+        return self.domain_leads("""
+            NOT EXISTS (
+                SELECT 1 FROM filtered_shops WHERE filtered_shops.domain = leads.domain
+            )
+            """)
+
+    def unenriched_leads(self):
+        # One lead per domain, so every shop is crawled once
+        return self.domain_leads("""
+            NOT EXISTS (
+                SELECT 1 FROM enriched_leads WHERE enriched_leads.domain = leads.domain
+            )
+            AND NOT EXISTS (
+                SELECT 1 FROM enriched_leads
+                WHERE enriched_leads.company = leads.company AND enriched_leads.domain IS NULL
+            )
+            """)
+
+    # Enrichment
+
+    def is_domain_enriched(self, website):
+        return self.exists(
+            "SELECT 1 FROM enriched_leads WHERE domain = ?",
+            (registrable_domain(website),),
+        )
+
+    def add_enriched_lead(self, company, website=None):
+        # A shop crawled again keeps one row with its latest company name
+        self.execute(
+            """
+            INSERT INTO enriched_leads (company, enriched_at, domain) VALUES (?, ?, ?)
+            ON CONFLICT (domain) DO UPDATE
+            SET company = excluded.company, enriched_at = excluded.enriched_at
+            """,
+            (company, time.time(), registrable_domain(website) if website else None),
+        )
+
+    def add_page(self, url, company, status):
+        self.execute(
+            "INSERT OR REPLACE INTO pages (url, company, status, fetched_at) VALUES (?, ?, ?, ?)",
+            (url, company, status, time.time()),
+        )
+
+    def add_contact(self, company, kind, value, site, page):
+        self.execute(
+            "INSERT OR IGNORE INTO contacts (company, kind, value, site, page, found_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (company, kind, value, site, page, time.time()),
+        )
+
+    # Dead domains
+
+    def dead_domains(self):
+        # Expired entries are kept so the next failure backs off further
+        rows = self.execute(
+            "SELECT domain, failure, failures, retry_at FROM dead_domains"
+        )
+
+        return {
+            domain: (failure, failures, retry_at)
+            for domain, failure, failures, retry_at in rows
+        }
+
+    def add_dead_domain(self, domain, failure, failures, retry_at):
+        self.execute(
+            "INSERT OR REPLACE INTO dead_domains (domain, failure, failures, retry_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+            (domain, failure, failures, retry_at, time.time()),
+        )
+
+    def remove_dead_domain(self, domain):
+        self.execute("DELETE FROM dead_domains WHERE domain = ?", (domain,))
+
+    # Work queue
+
+    def enqueue_work(self, queue, items):
+        # Items that were queued before keep their status
+        now = time.time()
+
+        with self.connection() as connection:
+            connection.executemany(
+                "INSERT OR IGNORE INTO work_queue (queue, item, payload, status, updated_at) VALUES (?, ?, ?, 'pending', ?)",
+                [(queue, item, payload, now) for item, payload in items],
+            )
+
+    def claim_work(self, queue, owner, lease_seconds, max_attempts):
+        now = time.time()
+
+        with self.connection() as connection:
+            # Expired leases that used up their attempts are given up
+            connection.execute(
+                """
+                UPDATE work_queue SET status = 'failed', updated_at = ?
+                WHERE queue = ? AND status = 'leased' AND lease_until < ? AND attempts >= ?
+                """,
+                (now, queue, now, max_attempts),
+            )
+
+            # A single statement so no two workers can claim the same item
+            return connection.execute(
+                """
+                UPDATE work_queue
+                SET status = 'leased', owner = ?, lease_until = ?, attempts = attempts + 1, updated_at = ?
+                WHERE rowid = (
+                    SELECT rowid FROM work_queue
+                    WHERE queue = ?
+                    AND (status = 'pending' OR (status = 'leased' AND lease_until < ?))
+                    ORDER BY rowid
+                    LIMIT 1
+                )
+                RETURNING item, payload
+                """,
+                (owner, now + lease_seconds, now, queue, now),
+            ).fetchone()
+
+    def renew_lease(self, queue, item, owner, lease_seconds):
+        now = time.time()
+
+        cursor = self.execute(
+            """
+            UPDATE work_queue SET lease_until = ?, updated_at = ?
+            WHERE queue = ? AND item = ? AND owner = ? AND status = 'leased'
+            """,
+            (now + lease_seconds, now, queue, item, owner),
+        )
+
+        return cursor.rowcount == 1
+
+    def complete_work(self, queue, item, owner):
+        # Only the current lease holder can complete an item
+        cursor = self.execute(
+            """
+            UPDATE work_queue SET status = 'done', updated_at = ?
+            WHERE queue = ? AND item = ? AND owner = ? AND status = 'leased'
+            """,
+            (time.time(), queue, item, owner),
+        )
+
+        return cursor.rowcount == 1
+
+    def release_work(self, queue, item, owner, max_attempts):
+        cursor = self.execute(
+            """
+            UPDATE work_queue
+            SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,
+                owner = NULL, lease_until = NULL, updated_at = ?
+            WHERE queue = ? AND item = ? AND owner = ? AND status = 'leased'
+            """,
+            (max_attempts, time.time(), queue, item, owner),
+        )
+
+        return cursor.rowcount == 1
+
+    def work_counts(self, queue):
+        rows = self.execute(
+            "SELECT status, COUNT(*) FROM work_queue WHERE queue = ? GROUP BY status",
+            (queue,),
+        )
+
+        return dict(rows.fetchall())
+
+
+def lead_row(row):
+    product, company, website, technology, domain, products = row
+
+    return {
+        "product": product,
+        "company": company,
+        "website": website,
+        "technology": technology or "",
+        "domain": domain,
+        "products": json.loads(products),
+    }
+
+
+def get_store(path=DATABASE_PATH):
+    # One store per database so every stage and thread shares it
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = StateStore(path)
+
+        return _stores[path]
+
+
+if __name__ == "__main__":
+    store = get_store()
+    store.import_leads_files()
+
+    print(f"State stored in {store.path}")
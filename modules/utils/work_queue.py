@@ -0,0 +1,259 @@
+import os
+import hmac
+import json
+import time
+import socket
+import argparse
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from modules.utils import http_client, metrics
+from modules.utils.state_store import get_store
+
+# Seconds a claimed item stays with its worker without a heartbeat
+LEASE_SECONDS = 300
+
+# Claims of an item before it is given up
+MAX_ATTEMPTS = 3
+
+# Seconds between lease renewals of an item that is being processed
+HEARTBEAT_INTERVAL = LEASE_SECONDS / 3
+
+# Seconds to wait for leases held by other workers to finish or expire
+POLL_INTERVAL = 10
+
+QUEUE_PORT = 8777
+
+# Shared secret sent by every worker, required when the queue is served on
+# anything but the loopback interface
+TOKEN_VARIABLE = "WORK_QUEUE_TOKEN"
+
+LOCAL_HOSTS = ["127.0.0.1", "localhost", "::1"]
+
+
+def worker_id():
+    # Unique over hosts, processes and threads
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+class WorkQueue:
+    # Queue in the state store, shared by every process using the same file
+    def __init__(
+        self, name, store=None, lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS
+    ):
+        self.name = name
+        self.store = store or get_store()
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+
+    def enqueue(self, items):
+        self.store.enqueue_work(self.name, items)
+
+    def claim(self, owner):
+        return self.store.claim_work(
+            self.name, owner, self.lease_seconds, self.max_attempts
+        )
+
+    def renew(self, item, owner):
+        return self.store.renew_lease(self.name, item, owner, self.lease_seconds)
+
+    def complete(self, item, owner):
+        return self.store.complete_work(self.name, item, owner)
+
+    def release(self, item, owner):
+        return self.store.release_work(self.name, item, owner, self.max_attempts)
+
+    def counts(self):
+        return self.store.work_counts(self.name)
+
+
+class RemoteQueue:
+    # Same interface as WorkQueue, served by another host with serve_queue()
+    def __init__(self, name, url, token=None):
+        self.name = name
+        self.url = url.rstrip("/")
+        self.token = token or os.environ.get(TOKEN_VARIABLE)
+
+    def call(self, method, **params):
+        headers = {"Authorization": f"Bearer {self.token}"} if self.token else {}
+
+        response = http_client.get_session().post(
+            f"{self.url}/{method}",
+            json={"queue": self.name, **params},
+            headers=headers,
+            timeout=30,
+        )
+        response.raise_for_status()
+
+        return response.json()["result"]
+
+    def enqueue(self, items):
+        return self.call("enqueue", items=list(items))
+
+    def claim(self, owner):
+        return self.call("claim", owner=owner)
+
+    def renew(self, item, owner):
+        return self.call("renew", item=item, owner=owner)
+
+    def complete(self, item, owner):
+        return self.call("complete", item=item, owner=owner)
+
+    def release(self, item, owner):
+        return self.call("release", item=item, owner=owner)
+
+    def counts(self):
+        return self.call("counts")
+
+
+def get_queue(name, url=None):
+    if url:
+        return RemoteQueue(name, url)
+
+    return WorkQueue(name)
+
+
+@contextmanager
+def leased(queue, item, owner):
+    # Keep renewing the lease while the item is processed, so only the
+    # leases of crashed or stuck workers expire
+    stopped = threading.Event()
+
+    def heartbeat():
+        while not stopped.wait(HEARTBEAT_INTERVAL):
+            try:
+                if not queue.renew(item, owner):
+                    print(f"[{item}] Lease lost")
+                    return
+            except Exception as e:
+                metrics.count_exception("queue", e)
+
+    thread = threading.Thread(target=heartbeat, name="lease-heartbeat", daemon=True)
+    thread.start()
+
+    try:
+        yield
+    finally:
+        stopped.set()
+        thread.join()
+
+
+def run_worker(queue, process):
+    # Claim items until the queue is drained, process(item, payload) must be
+    # safe to repeat for an item whose earlier lease expired
+    owner = worker_id()
+    processed = 0
+
+    while True:
+        job = queue.claim(owner)
+
+        if job is None:
+            counts = queue.counts()
+            metrics.set_gauge("queue_depth", counts.get("pending", 0), queue=queue.name)
+
+            # Wait for items leased by other workers, they may come back
+            if counts.get("leased", 0) == 0:
+                break
+
+            time.sleep(POLL_INTERVAL)
+            continue
+
+        item, payload = job
+
+        try:
+            with leased(queue, item, owner):
+                process(item, payload)
+        except Exception as e:
+            metrics.count_exception("queue", e)
+            print(f"[{item}] Error: {e}")
+
+            queue.release(item, owner)
+            continue
+
+        if queue.complete(item, owner):
+            processed += 1
+            metrics.inc("queue_completed_total", queue=queue.name)
+        else:
+            print(f"[{item}] Lease expired before completion")
+
+    return processed
+
+
+class QueueHandler(BaseHTTPRequestHandler):
+    queues = {}
+    token = None
+
+    def authorized(self):
+        if not self.token:
+            return True
+
+        header = self.headers.get("Authorization", "")
+
+        return hmac.compare_digest(header.encode(), f"Bearer {self.token}".encode())
+
+    def do_POST(self):
+        if not self.authorized():
+            self.send_error(401)
+            return
+
+        params = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        name = params.pop("queue")
+        method = self.path.strip("/")
+
+        if name not in self.queues:
+            self.queues[name] = WorkQueue(name)
+
+        queue = self.queues[name]
+
+        if method == "enqueue":
+            result = queue.enqueue([tuple(item) for item in params["items"]])
+        elif method == "claim":
+            result = queue.claim(params["owner"])
+        elif method == "renew":
+            result = queue.renew(params["item"], params["owner"])
+        elif method == "complete":
+            result = queue.complete(params["item"], params["owner"])
+        elif method == "release":
+            result = queue.release(params["item"], params["owner"])
+        elif method == "counts":
+            result = queue.counts()
+        else:
+            self.send_error(404)
+            return
+
+        body = json.dumps({"result": result}).encode("utf-8")
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve_queue(port=QUEUE_PORT, host="127.0.0.1", token=None):
+    token = token or os.environ.get(TOKEN_VARIABLE)
+
+    # Anyone reaching the port could claim or complete items
+    if host not in LOCAL_HOSTS and not token:
+        raise ValueError(f"Set {TOKEN_VARIABLE} to serve the queue on {host}")
+
+    QueueHandler.token = token
+
+    server = ThreadingHTTPServer((host, port), QueueHandler)
+    server.daemon_threads = True
+
+    print(f"Serving work queues from {get_store().path} on {host}:{port}")
+
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=QUEUE_PORT)
+    parser.add_argument("--host", default="127.0.0.1")
+    args = parser.parse_args()
+
+    serve_queue(args.port, args.host)